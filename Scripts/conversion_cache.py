@@ -0,0 +1,129 @@
+"""
+conversion_cache.py — Content-addressed cache for PDF → Markdown output
+Shared by pdf_to_md.py and paper_converter.py — keep it next to them.
+
+An entry is keyed by the SHA-256 of the PDF bytes plus the converter's name,
+version and options, so a renamed, moved or duplicated PDF is a hit, while a
+converter upgrade or a changed setting (e.g. table_strategy) is a miss.
+
+Hits are materialised as hardlinks to the cached file (falling back to a
+copy across filesystems, or always copying with link=False).  A hardlinked
+output shares its bytes with the cache: replace it rather than editing it in
+place.  Reads bump an entry's mtime, and `prune` evicts the least recently
+used entries down to a size limit.
+
+Layout:  <cache_dir>/<key[:2]>/<key>.md
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(os.environ.get(
+    "PDF_MD_CACHE_DIR",
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "pdf_md",
+))
+_READ_CHUNK = 1 << 20
+
+
+def package_version(*dists: str) -> str:
+    """Installed versions of `dists` joined with "+" ("?" for any not found)."""
+    from importlib.metadata import version, PackageNotFoundError
+    found = []
+    for dist in dists:
+        try:
+            found.append(version(dist))
+        except PackageNotFoundError:
+            found.append("?")
+    return "+".join(found)
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_READ_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(pdf_path: Path, converter: str, version: str, options: dict) -> str:
+    """Hash of the PDF content, the converter identity and its options."""
+    settings = json.dumps([converter, version, options], sort_keys=True, default=str)
+    return hashlib.sha256(f"{file_sha256(pdf_path)}\n{settings}".encode()).hexdigest()
+
+
+def _entry(cache_dir: Path, key: str) -> Path:
+    return Path(cache_dir) / key[:2] / f"{key}.md"
+
+
+def has(key: str, cache_dir: Path = DEFAULT_CACHE_DIR) -> bool:
+    return _entry(cache_dir, key).exists()
+
+
+def materialize(key: str, dest: Path, cache_dir: Path = DEFAULT_CACHE_DIR,
+                link: bool = True) -> bool:
+    """
+    Place the cached output for `key` at `dest`.  Returns False on a miss.
+    """
+    entry = _entry(cache_dir, key)
+    if not entry.exists():
+        return False
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    try:
+        if link:
+            try:
+                os.link(entry, tmp)
+            except OSError:             # other filesystem, or no hardlink support
+                shutil.copyfile(entry, tmp)
+        else:
+            shutil.copyfile(entry, tmp)
+        os.replace(tmp, dest)
+    except FileNotFoundError:           # evicted by a concurrent prune
+        return False
+    finally:
+        tmp.unlink(missing_ok=True)
+    os.utime(entry)                     # LRU: mark as recently used
+    return True
+
+
+def store(key: str, src: Path, cache_dir: Path = DEFAULT_CACHE_DIR) -> None:
+    """Copy a freshly written output into the cache (atomic, last writer wins)."""
+    entry = _entry(cache_dir, key)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, entry)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def prune(max_bytes: int, cache_dir: Path = DEFAULT_CACHE_DIR) -> tuple[int, int]:
+    """
+    Delete least recently used entries until the cache holds at most
+    `max_bytes`.  Returns (entries removed, bytes freed).
+    """
+    entries = []
+    for entry in Path(cache_dir).glob("??/*.md"):
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime_ns, st.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        entry.unlink(missing_ok=True)
+        total   -= size
+        freed   += size
+        removed += 1
+    return removed, freed
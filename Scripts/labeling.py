@@ -0,0 +1,1310 @@
+"""
+labeling.py
+────────────────────────────────────────────────────────────────────────────────
+Shared engine behind universal_labeler.py and labeler_non_universal.py — keep
+it next to those scripts.
+
+  walking     scan_tree (auto-discovered depth, optional thread pool and
+              manifest-backed listings) and scan_fixed_depth (known depth)
+  rows        slot-ordered tuples, label tally, train/val/test split
+  stages      per-file process-pool passes cached by (path, size, mtime)
+  outputs     write_outputs → CSV, write-only XLSX, Parquet / Arrow IPC
+────────────────────────────────────────────────────────────────────────────────
+"""
+
+import os
+import csv
+import json
+import math
+import mmap
+import re
+import time
+import hashlib
+import shutil
+import tempfile
+import openpyxl
+from collections import Counter
+from functools import partial
+from bisect import bisect_right
+from itertools import accumulate, chain, islice
+from typing import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+
+IMAGE_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif",
+    ".webp", ".gif", ".heic", ".heif", ".svg",
+}
+
+EXCEL_MAX_ROWS = 1_048_576   # per worksheet, including the header row
+
+DEFAULT_SPLIT_RATIOS = {"train": 0.8, "val": 0.1, "test": 0.1}
+
+# Default budget for the sampled first-run discovery (see `sampling_lister`)
+DISCOVERY_CHILDREN    = 8          # subfolders followed per folder
+DISCOVERY_MAX_ENTRIES = 200_000    # directory entries listed in total
+DISCOVERY_SECONDS     = 5.0        # wall-clock limit
+
+# Slots filled by the optional per-file stages, after the level slots.
+# Enabling any of them in "columns" switches the stage on.
+EXTRA_SLOTS = [
+    "content_hash",      # BLAKE2b of the file bytes           ┐ duplicate
+    "duplicate_group",   # shared id for exact / near copies   ┘ detection
+    "width",             # pixels                              ┐
+    "height",            # pixels                              │ image
+    "channels",          # number of bands (1 = L, 3 = RGB, …)  │ metadata
+    "format",            # JPEG, PNG, …                        │
+    "file_size",         # bytes                               ┘
+    "valid",             # yes / no from the integrity check     validation
+]
+METADATA_SLOTS = ["width", "height", "channels", "format", "file_size"]
+INT_SLOTS = {"duplicate_group", "width", "height", "channels", "file_size"}
+
+OUTPUT_FORMATS = {           # "formats" config value → file extension
+    "csv":     ".csv",
+    "xlsx":    ".xlsx",
+    "parquet": ".parquet",
+    "arrow":   ".arrow",
+}
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  STRUCTURE DISCOVERY
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _is_image(fname: str) -> bool:
+    return os.path.splitext(fname)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _list_dir(path: str) -> tuple[list[str], list[str]]:
+    """
+    Read one directory with a single `os.scandir` call and return
+    (images, subdirs), both sorted.  DirEntry caches the file type from the
+    directory read itself, so no per-entry stat is needed.
+    """
+    images:  list[str] = []
+    subdirs: list[str] = []
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name
+            if entry.is_dir():
+                if not name.startswith("."):
+                    subdirs.append(name)
+            elif _is_image(name) and entry.is_file():
+                images.append(name)
+    images.sort()
+    subdirs.sort()
+    return images, subdirs
+
+
+def scan_tree(base_dir: str, info: dict | None = None, jobs: int = 1,
+              list_dir=_list_dir) -> Iterator[tuple[tuple[str, ...], str]]:
+    """
+    Single-pass walk shared by discovery and row collection.
+
+    Lazily yields (labels, fname) for every image: a folder's own images first,
+    then its subfolders, everything in sorted order.  If `info` is given it is
+    filled in during the same pass with "max_depth" (deepest level holding
+    images) and "sample_tree" (first 3 images per folder).
+
+    With jobs > 1 directory listings run on a thread pool: every listed folder
+    immediately queues its subfolders, so idle workers pick up whatever part of
+    the tree is still pending.  Rows are still yielded in the sequential order.
+
+    `list_dir(path) -> (images, subdirs)` can be swapped for a cached lister
+    (see `manifest_lister`).
+    """
+    if info is None:
+        info = {}
+    info["max_depth"]   = 0
+    info["sample_tree"] = {}
+
+    def _walk(labels: tuple[str, ...], node: dict, listing):
+        images, subdirs, children = listing()
+
+        if images:
+            node["__images__"] = images[:3]
+            info["max_depth"] = max(info["max_depth"], len(labels))
+            for fname in images:
+                yield labels, fname
+
+        for d, child in zip(subdirs, children):
+            node[d] = {}
+            yield from _walk(labels + (d,), node[d], child)
+
+    if jobs <= 1:
+        def _expand(path: str):
+            images, subdirs = list_dir(path)
+            return images, subdirs, [partial(_expand, os.path.join(path, d)) for d in subdirs]
+
+        yield from _walk((), info["sample_tree"], partial(_expand, base_dir))
+        return
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+
+    def _fetch(path: str):
+        images, subdirs = list_dir(path)
+        return images, subdirs, [pool.submit(_fetch, os.path.join(path, d)).result for d in subdirs]
+
+    try:
+        yield from _walk((), info["sample_tree"], pool.submit(_fetch, base_dir).result)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def scan_fixed_depth(base_dir: str, depth: int,
+                     images_only: bool = False) -> Iterator[tuple[tuple[str, ...], str]]:
+    """
+    Walker for trees whose depth is known up front (labeler_non_universal.py).
+
+    Yields (labels, fname) for every file exactly `depth` folders below
+    `base_dir`, in the same sorted order as `scan_tree`.  Folders above the
+    leaf level are only searched for subfolders and leaf folders only for
+    files, so nothing below the leaf level is ever listed and no depth or
+    sample tree is tracked.
+    """
+    def _walk(path: str, labels: tuple[str, ...]):
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        if len(labels) < depth:
+            for entry in entries:
+                if entry.is_dir():
+                    yield from _walk(entry.path, labels + (entry.name,))
+        else:
+            for entry in entries:
+                if entry.is_file() and (not images_only or _is_image(entry.name)):
+                    yield labels, entry.name
+
+    yield from _walk(base_dir, ())
+
+
+def sampling_lister(list_dir, children: int | None, max_entries: int | None,
+                    seconds: float | None, stats: dict):
+    """
+    Wrap `list_dir` for a bounded discovery walk.  At most `children`
+    subfolders of every folder are followed (spread evenly over the sorted
+    list, first one included); once `max_entries` entries have been listed or
+    `seconds` have passed, every further folder reads as empty.  `stats` is
+    filled with "dirs", "entries", "skipped" (subfolders not followed) and
+    "unlisted" (folders cut off by the budget).
+    """
+    stats.update(dirs=0, entries=0, skipped=0, unlisted=0)
+    deadline = time.monotonic() + seconds if seconds else None
+
+    def _list(path: str) -> tuple[list[str], list[str]]:
+        if ((max_entries and stats["entries"] >= max_entries)
+                or (deadline and time.monotonic() >= deadline)):
+            stats["unlisted"] += 1
+            return [], []
+        images, subdirs = list_dir(path)
+        stats["dirs"]    += 1
+        stats["entries"] += len(images) + len(subdirs)
+        if children and len(subdirs) > children:
+            stats["skipped"] += len(subdirs) - children
+            subdirs = [subdirs[i * len(subdirs) // children] for i in range(children)]
+        return images, subdirs
+
+    return _list
+
+
+def discover_structure(base_dir: str, jobs: int = 1, list_dir=_list_dir,
+                       children: int | None = None, max_entries: int | None = None,
+                       seconds: float | None = None) -> dict:
+    """
+    Walk the tree, find the deepest level that contains images,
+    and return a config skeleton with all folder slots enabled and named by
+    their slot key.  Slots that need an extra pass over the image files start
+    out disabled.
+
+    Any of `children`, `max_entries` or `seconds` turns the walk into a sample
+    (see `sampling_lister`); the config's "_discovery" entry then records how
+    much of the tree was seen, and "max_depth" is only a lower bound.
+    """
+    stats: dict = {}
+    sampled = bool(children or max_entries or seconds)
+    if sampled:
+        list_dir = sampling_lister(list_dir, children, max_entries, seconds, stats)
+
+    info: dict = {}
+    t0 = time.perf_counter()
+    for _ in scan_tree(base_dir, info, jobs, list_dir):
+        pass
+    max_depth   = info["max_depth"]
+    sample_tree = info["sample_tree"]
+    discovery   = {
+        "mode":     "sampled" if sampled else "full",
+        "complete": not (stats.get("skipped") or stats.get("unlisted")),
+        "seconds":  round(time.perf_counter() - t0, 2),
+        **stats,
+    }
+
+    # Build the columns dict: fixed slots first, then one per level
+    columns = {
+        "filename": {"header": "filename", "enabled": True},
+        "path":     {"header": "path",     "enabled": True},
+    }
+    for i in range(max_depth):
+        key = f"level_{i + 1}"
+        columns[key] = {"header": key, "enabled": True}
+    for key in ["split"] + EXTRA_SLOTS:
+        columns[key] = {"header": key, "enabled": False}
+
+    return {
+        "max_depth":   max_depth,
+        "columns":     columns,
+        "output_stem": "dataset",
+        "formats":     ["csv", "xlsx"],
+        "xlsx_rows_per_sheet": EXCEL_MAX_ROWS - 1,
+        "xlsx_split":  "sheets",
+        "split_ratios":   dict(DEFAULT_SPLIT_RATIOS),
+        "split_stratify": ["level_1"],
+        "split_seed":     0,
+        "near_duplicate_distance": 4,
+        "validation":  "header",
+        "_sample_tree": sample_tree,
+        "_discovery":   discovery,
+    }
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  DIRECTORY MANIFEST
+# ══════════════════════════════════════════════════════════════════════════════
+
+# Directory listings from the previous run, keyed by path relative to BASE_DIR:
+#   {"mtime_ns": …, "images": […], "subdirs": […]}
+# A directory whose mtime is unchanged is not re-listed; adding, removing or
+# renaming an entry always bumps the mtime of the directory that holds it.
+
+MANIFEST_VERSION = 1
+_RACY_WINDOW_NS  = 2_000_000_000   # mtimes this close to the scan are not trusted
+
+
+def load_manifest(path: str) -> dict:
+    """Return the saved manifest, or {} if it is missing, unreadable or outdated."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def save_manifest(path: str, dirs: dict, fingerprint: str | None, outputs: list[str]) -> None:
+    manifest = {
+        "version":     MANIFEST_VERSION,
+        "fingerprint": fingerprint,
+        "outputs":     outputs,
+        "dirs":        dirs,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def config_fingerprint(config: dict) -> str:
+    """Hash of everything in the config that affects the outputs."""
+    relevant = {k: v for k, v in config.items() if not k.startswith("_")}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+def files_fingerprint(base_dir: str, rel_paths: list[str]) -> str:
+    """
+    Hash of every file's (path, size, mtime).  Per-file columns depend on
+    file contents, and overwriting a file in place does not touch its
+    directory's mtime, so the directory manifest alone can't vouch for them.
+    A file modified within the racy window never matches.
+    """
+    h = hashlib.sha1()
+    scan_start_ns = time.time_ns()
+    for rel in rel_paths:
+        try:
+            st = os.stat(os.path.join(base_dir, rel))
+        except OSError:
+            h.update(f"{rel}\0-\n".encode())
+            continue
+        if st.st_mtime_ns >= scan_start_ns - _RACY_WINDOW_NS:
+            h.update(os.urandom(8))
+        h.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def manifest_lister(base_dir: str, old_dirs: dict, new_dirs: dict, changed: list):
+    """
+    Build a `list_dir` for `scan_tree` that stats each directory and reuses the
+    listing in `old_dirs` when its mtime is unchanged.  Every listing is stored
+    in `new_dirs`; directories whose contents differ from `old_dirs` are
+    appended to `changed`.  Safe to call from the --jobs thread pool.
+    """
+    scan_start_ns = time.time_ns()
+
+    def _list(path: str) -> tuple[list[str], list[str]]:
+        rel   = os.path.relpath(path, base_dir)
+        mtime = os.stat(path).st_mtime_ns
+        old   = old_dirs.get(rel)
+
+        if old is not None and old["mtime_ns"] == mtime:
+            images, subdirs = old["images"], old["subdirs"]
+        else:
+            images, subdirs = _list_dir(path)
+            if old is None or old["images"] != images or old["subdirs"] != subdirs:
+                changed.append(rel)
+
+        # A directory modified within the mtime resolution of this scan could
+        # change again without its mtime moving, so force a re-list next run.
+        trusted = mtime < scan_start_ns - _RACY_WINDOW_NS
+        new_dirs[rel] = {
+            "mtime_ns": mtime if trusted else None,
+            "images":   images,
+            "subdirs":  subdirs,
+        }
+        return images, subdirs
+
+    return _list
+
+
+def frozen_lister(base_dir: str, dirs: dict):
+    """A `list_dir` that serves listings straight from `dirs` without touching disk."""
+    def _list(path: str) -> tuple[list[str], list[str]]:
+        entry = dirs[os.path.relpath(path, base_dir)]
+        return entry["images"], entry["subdirs"]
+
+    return _list
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  PER-FILE STAGES
+# ══════════════════════════════════════════════════════════════════════════════
+
+# Optional passes that have to open every image.  Each one runs in a process
+# pool and caches its per-file result keyed by (path, size, mtime), so a
+# re-run only touches new or modified files.
+
+def run_file_stage(base_dir: str, rel_paths: list[str], func, cache_path: str,
+                   workers: int, desc: str) -> dict:
+    """
+    Return {rel_path: func(abs_path)} for every path, computing only the
+    entries missing from (or stale in) the JSON cache at `cache_path`.
+    `func` must be a module-level function returning JSON-serialisable data.
+    """
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    results: dict = {}
+    fresh:   dict = {}
+    todo:    list = []
+    for rel in rel_paths:
+        try:
+            st = os.stat(os.path.join(base_dir, rel))
+        except OSError:
+            continue
+        hit = cache.get(rel)
+        if hit is not None and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            results[rel] = hit[2]
+            fresh[rel] = hit
+        else:
+            todo.append((rel, st.st_size, st.st_mtime_ns))
+
+    print(f"  {desc}: {len(results)} cached, {len(todo)} to process")
+    if todo:
+        abs_paths = [os.path.join(base_dir, rel) for rel, _, _ in todo]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for (rel, size, mtime), result in zip(todo, pool.map(func, abs_paths, chunksize=64)):
+                results[rel] = result
+                fresh[rel] = [size, mtime, result]
+
+    # Rewrite the cache with only the files that still exist
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(fresh, f, separators=(",", ":"))
+    os.replace(tmp_path, cache_path)
+    return results
+
+
+# ── Image metadata ────────────────────────────────────────────────────────────
+
+def read_image_header(path: str) -> list:
+    """
+    Return [width, height, channels, format, file_size] for one file
+    (process-pool worker).  Image.open only parses the header — no pixels are
+    decoded.  Fields Pillow can't determine are left as "".
+    """
+    try:
+        file_size = os.path.getsize(path)
+    except OSError:
+        return ["", "", "", "", ""]
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            return [im.width, im.height, len(im.getbands()), im.format or "", file_size]
+    except Exception:
+        return ["", "", "", "", file_size]
+
+
+# ── Integrity validation ──────────────────────────────────────────────────────
+
+# Formats Pillow can't decode without plugins; only the empty-file check applies.
+_UNCHECKED_EXTENSIONS = {".svg", ".heic", ".heif"}
+
+def _jpeg_has_end(data) -> bool:
+    """
+    Walk the JPEG segments from SOI and report whether an EOI marker is
+    reached.  Anything appended after EOI (the video of a motion photo,
+    vendor trailers) is never looked at, so it doesn't matter what it holds.
+    """
+    n = len(data)
+    if data[:2] != b"\xff\xd8":
+        return False
+    pos = 2
+    while True:
+        pos = data.find(b"\xff", pos)
+        while 0 <= pos < n and data[pos] == 0xFF:       # fill bytes before a marker
+            pos += 1
+        if pos < 0 or pos >= n:
+            return False
+        marker = data[pos]
+        pos += 1
+        if marker == 0xD9:                               # EOI
+            return True
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:     # RSTn / TEM carry no length
+            continue
+        if pos + 2 > n:
+            return False
+        pos += int.from_bytes(data[pos:pos + 2], "big")
+        if marker == 0xDA:
+            # Entropy-coded scan data runs up to the first 0xFF that isn't a
+            # stuffed 0x00 or a restart marker
+            while True:
+                pos = data.find(b"\xff", pos)
+                if pos < 0 or pos + 1 >= n:
+                    return False
+                if data[pos + 1] == 0x00 or 0xD0 <= data[pos + 1] <= 0xD7:
+                    pos += 2
+                else:
+                    break
+
+
+def _png_has_end(data) -> bool:
+    """Walk the PNG chunks after the signature and report whether IEND is reached."""
+    n = len(data)
+    pos = 8
+    while pos + 8 <= n:
+        length = int.from_bytes(data[pos:pos + 4], "big")
+        if data[pos + 4:pos + 8] == b"IEND":
+            return True
+        pos += 12 + length                               # length, type, data, CRC
+    return False
+
+
+# Formats whose end-of-image marker is looked for by walking their structure
+_END_CHECKS = {"JPEG": _jpeg_has_end, "PNG": _png_has_end}
+
+
+def _failure(e: Exception) -> str:
+    if type(e).__name__ == "UnidentifiedImageError":
+        return "not a recognised image format"
+    return f"{type(e).__name__}: {e}"
+
+
+def _verify(path: str) -> tuple:
+    """
+    (reason, format) from the checks both modes share: empty or unreadable
+    files, unparseable headers and broken chunk structure (`Image.verify`).
+    Formats in _UNCHECKED_EXTENSIONS get only the empty-file check.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        return f"unreadable: {e.strerror}", None
+    if size == 0:
+        return "empty file", None
+    if os.path.splitext(path)[1].lower() in _UNCHECKED_EXTENSIONS:
+        return "", None
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            fmt = im.format
+            im.verify()
+    except Exception as e:
+        return _failure(e), None
+    return "", fmt
+
+
+def check_image_header(path: str) -> str:
+    """
+    Cheap integrity check (process-pool worker); returns "" if the file looks
+    sound, else the reason.  Catches empty files, unparseable headers, broken
+    chunk structure (`Image.verify`) and JPEG / PNG files cut off before their
+    end-of-image marker — without decoding any pixels.  The marker is found
+    by walking segments / chunks, so data appended after it is fine.
+    """
+    reason, fmt = _verify(path)
+    has_end = _END_CHECKS.get(fmt)
+    if reason or not has_end:
+        return reason
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if not has_end(data):
+                return "truncated: no end-of-image marker"
+    except OSError as e:
+        return f"unreadable: {e.strerror}"
+    return ""
+
+
+def check_image_decode(path: str) -> str:
+    """
+    Thorough integrity check (process-pool worker): the header checks, then a
+    full decode of the pixel data, which also catches corrupt scan data.
+    Whether the image is complete is left to the decoder rather than the
+    end-marker walk.
+    """
+    reason, _ = _verify(path)
+    if reason or os.path.splitext(path)[1].lower() in _UNCHECKED_EXTENSIONS:
+        return reason
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            im.load()
+    except Exception as e:
+        return _failure(e)
+    return ""
+
+
+VALIDATION_CHECKS = {        # "validation" config value → worker
+    "header": check_image_header,
+    "decode": check_image_decode,
+}
+
+
+# ── Duplicate detection ───────────────────────────────────────────────────────
+
+def _dhash(path: str) -> str:
+    """64-bit difference hash as 16 hex chars, or "" if Pillow can't read the image."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return ""
+    try:
+        with Image.open(path) as im:
+            im.draft("L", (64, 64))   # JPEG: let the decoder downscale for us
+            px = im.convert("L").resize((9, 8), Image.BILINEAR).tobytes()
+    except Exception:
+        return ""
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_image(path: str) -> list[str]:
+    """Return [content_hash, perceptual_hash] for one file (process-pool worker)."""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return ["", ""]
+    return [h.hexdigest(), _dhash(path)]
+
+
+class _BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance."""
+
+    def __init__(self) -> None:
+        self.root = None   # node: [hash, [item, …], {distance: child}]
+
+    def add(self, value: int, item) -> None:
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = (value ^ node[0]).bit_count()
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> list:
+        found: list = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = (value ^ node[0]).bit_count()
+            if d <= radius:
+                found.extend(node[1])
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def find_duplicates(rel_paths: list[str], hashes: dict,
+                    max_distance: int) -> tuple[dict, list[tuple]]:
+    """
+    Group files with identical content, plus (if max_distance > 0) files whose
+    perceptual hashes are within `max_distance` bits, using a BK-tree instead
+    of comparing every pair.
+
+    Returns ({rel_path: group_id} for every file in a group of 2+,
+             rows for the Duplicates sheet: (group, path, content_hash, match)).
+    """
+    parent = list(range(len(rel_paths)))
+
+    def _find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _union(i: int, j: int) -> None:
+        ri, rj = _find(i), _find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    first_by_content: dict[str, int] = {}
+    tree = _BKTree()
+    for i, rel in enumerate(rel_paths):
+        content, phash = hashes.get(rel, ["", ""])
+        if content:
+            j = first_by_content.setdefault(content, i)
+            if j != i:
+                _union(i, j)
+                continue   # identical bytes → identical perceptual hash
+        if max_distance > 0 and phash:
+            value = int(phash, 16)
+            for j in tree.search(value, max_distance):
+                _union(i, j)
+            tree.add(value, i)
+
+    members: dict[int, list[int]] = {}
+    for i in range(len(rel_paths)):
+        members.setdefault(_find(i), []).append(i)
+
+    groups: dict[str, int] = {}
+    sheet_rows: list[tuple] = []
+    group_id = 0
+    for root in sorted(members):
+        idx = members[root]
+        if len(idx) < 2:
+            continue
+        group_id += 1
+        contents = [hashes[rel_paths[i]][0] for i in idx]
+        copies   = Counter(contents)
+        for i, content in zip(idx, contents):
+            match = "exact" if copies[content] > 1 else "near"
+            groups[rel_paths[i]] = group_id
+            sheet_rows.append((group_id, rel_paths[i], content, match))
+    return groups, sheet_rows
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  ROW COLLECTION
+# ══════════════════════════════════════════════════════════════════════════════
+
+def collect_rows(base_dir: str, max_depth: int, columns: dict, info: dict | None = None,
+                 jobs: int = 1, list_dir=_list_dir, extra: dict | None = None,
+                 split_of=None) -> Iterator[tuple]:
+    """
+    Lazily yield one tuple per image, values in `active_headers()` order.
+    `info`, `jobs` and `list_dir` are passed through to `scan_tree`.
+    `extra` maps each enabled EXTRA_SLOTS key to {relative path: value};
+    `split_of` (see `split_assigner`) fills the split slot.
+    """
+    extra = extra or {}
+    getters = []
+    for key in active_slots(columns, max_depth):
+        if key == "filename":
+            getters.append(lambda labels, fname: fname)
+        elif key == "path":
+            getters.append(lambda labels, fname: os.path.join(*labels, fname))
+        elif key == "split":
+            getters.append(split_of)
+        elif key in EXTRA_SLOTS:
+            values = extra.get(key, {})
+            getters.append(lambda labels, fname, values=values:
+                           values.get(os.path.join(*labels, fname), ""))
+        else:
+            i = int(key.split("_")[1]) - 1
+            getters.append(lambda labels, fname, i=i: labels[i] if i < len(labels) else "")
+
+    for labels, fname in scan_tree(base_dir, info, jobs, list_dir):
+        yield tuple([get(labels, fname) for get in getters])
+
+
+def active_slots(columns: dict, max_depth: int) -> list[str]:
+    """Return the enabled slot keys in output order."""
+    ordered_keys = (["filename", "path"] + [f"level_{i+1}" for i in range(max_depth)]
+                    + ["split"] + EXTRA_SLOTS)
+    return [k for k in ordered_keys if k in columns and columns[k].get("enabled", True)]
+
+
+def active_headers(columns: dict, max_depth: int) -> list[str]:
+    """Return headers in slot order, skipping disabled ones."""
+    return [columns[k]["header"] for k in active_slots(columns, max_depth)]
+
+
+def label_headers(columns: dict, max_depth: int) -> list[str]:
+    """Return only the level headers (for summary grouping), skipping disabled."""
+    return [
+        columns[f"level_{i+1}"]["header"]
+        for i in range(max_depth)
+        if columns.get(f"level_{i+1}", {}).get("enabled", True)
+    ]
+
+
+def int_positions(columns: dict, max_depth: int) -> list[int]:
+    """Return the row indices of the integer-valued slots (see INT_SLOTS)."""
+    return [i for i, k in enumerate(active_slots(columns, max_depth)) if k in INT_SLOTS]
+
+
+def label_positions(columns: dict, max_depth: int) -> list[int]:
+    """Return the row indices of the level slots, matching `label_headers()`."""
+    return [i for i, k in enumerate(active_slots(columns, max_depth)) if k.startswith("level_")]
+
+
+def tally_rows(rows: Iterable[tuple], label_idx: list[int], tally: Counter) -> Iterator[tuple]:
+    """
+    Pass rows through unchanged while counting each combination of label
+    values into `tally`.  The number of distinct combinations is the number of
+    leaf folders, so this stays small however many images stream past.
+    """
+    for row in rows:
+        tally[tuple([row[i] for i in label_idx])] += 1
+        yield row
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  TRAIN / VAL / TEST SPLIT
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _split_quotas(n: int, weights: list[float]) -> list[int]:
+    """Split n into counts proportional to `weights` (largest remainder, so they sum to n)."""
+    exact  = [n * w for w in weights]
+    counts = [math.floor(x) for x in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda k: counts[k] - exact[k])
+    for k in by_remainder[:n - sum(counts)]:
+        counts[k] += 1
+    return counts
+
+
+def split_assigner(ratios: dict[str, float], items: Iterable[tuple],
+                   levels: list[int] = (), seed: int = 0):
+    """
+    Return f(labels, fname) -> split name, stratified by the label values at
+    the `levels` indices.  `items` are the (labels, fname) pairs of the whole
+    dataset, e.g. `scan_tree` over the manifest listings.
+
+    The seed and path are hashed to a point in [0, 1).  Within each stratum
+    the images are ranked by that point and the configured proportions are
+    turned into exact counts, so even a small stratum gets its share of every
+    split.  Only the points where one split's quota ends are kept per stratum,
+    so rows can still stream.  The ranks come from the hash, so an image
+    changes split only when images added to or removed from its stratum move
+    a boundary past it.
+    """
+    names   = list(ratios)
+    total   = sum(ratios.values())
+    weights = [r / total for r in ratios.values()]
+    salt = f"{seed}:".encode()
+
+    def _point(labels, fname) -> float:
+        key = salt + "/".join([*labels, fname]).encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") / 2 ** 64
+
+    def _stratum(labels) -> tuple:
+        return tuple([labels[i] if i < len(labels) else "" for i in levels])
+
+    points: dict = {}
+    for labels, fname in items:
+        points.setdefault(_stratum(labels), []).append(_point(labels, fname))
+
+    # Per stratum, the point of the first image of each split after the first
+    bounds: dict = {}
+    for stratum, us in points.items():
+        us.sort()
+        ends = list(accumulate(_split_quotas(len(us), weights)))[:-1]
+        bounds[stratum] = [us[end] if end < len(us) else 1.0 for end in ends]
+    del points
+    # Images the listing didn't include fall back to the plain proportions
+    default = list(accumulate(weights))[:-1]
+
+    def _assign(labels, fname) -> str:
+        cuts = bounds.get(_stratum(labels), default)
+        return names[bisect_right(cuts, _point(labels, fname))]
+
+    return _assign
+
+
+def split_summary(tally: Counter, split_names: list[str],
+                   strata: list[tuple[int, str]]) -> tuple[list[tuple], int]:
+    """
+    Split totals and per-stratum split counts from the tally (whose keys carry
+    the split as their last element).  `strata` lists (key index, header) of
+    the stratification levels.  Also returns how many strata ended up with an
+    empty split.
+    """
+    totals:     Counter = Counter()
+    by_stratum: Counter = Counter()
+    for combo, n in tally.items():
+        totals[combo[-1]] += n
+        stratum = " / ".join(combo[j] or "(none)" for j, _ in strata)
+        by_stratum[(stratum, combo[-1])] += n
+
+    summary = [(f"split  =  {name}", totals[name]) for name in split_names]
+    label   = " × ".join(header for _, header in strata)
+    n_empty = 0
+    for stratum in sorted({st for st, _ in by_stratum}):
+        counts = [by_stratum[(stratum, name)] for name in split_names]
+        n_empty += 0 in counts
+        for name, count in zip(split_names, counts):
+            summary.append((f"split by {label}  =  {stratum} / {name}", count))
+    return summary, n_empty
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  CSV WRITER
+# ══════════════════════════════════════════════════════════════════════════════
+
+def write_csv(rows: Iterable[tuple], headers: list[str], path: str) -> int:
+    """Stream rows straight into csv.writer; returns the number of rows written."""
+    n_rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            n_rows += 1
+    return n_rows
+
+
+def read_csv_rows(path: str, int_idx: list[int] = ()) -> Iterator[tuple]:
+    """
+    Stream the data rows of a CSV written by `write_csv` back as tuples.
+    Columns in `int_idx` are turned back into ints ("" becomes None).
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        if not int_idx:
+            for row in reader:
+                yield tuple(row)
+            return
+        for row in reader:
+            for i in int_idx:
+                row[i] = int(row[i]) if row[i] else None
+            yield tuple(row)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  PARQUET / ARROW WRITER
+# ══════════════════════════════════════════════════════════════════════════════
+
+ARROW_BATCH_ROWS = 100_000   # rows per Parquet row group / Arrow record batch
+
+
+def write_columnar(rows: Iterable[tuple], headers: list[str], dict_idx: list[int],
+                   path: str, fmt: str, int_idx: list[int] = ()) -> bool:
+    """
+    Stream rows into a Parquet file (fmt="parquet") or an Arrow IPC file
+    (fmt="arrow") one batch at a time.  Columns in `dict_idx` (the level slots)
+    are dictionary-encoded against one dictionary per column that only ever
+    grows, so readers get integer codes instead of millions of repeated strings.
+    Columns in `int_idx` are stored as int64.
+
+    Read back with e.g.  pyarrow.parquet.read_table(path)  or, zero-copy,
+    pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all().
+    Returns False (and writes nothing) if pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print(f"  pyarrow not installed — skipping {fmt} output. Run: pip install pyarrow")
+        return False
+
+    dict_idx = set(dict_idx)
+    dict_type = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([
+        pa.field(header, dict_type if i in dict_idx else pa.int64() if i in int_idx else pa.string())
+        for i, header in enumerate(headers)
+    ])
+    vocab: dict[int, dict[str, int]] = {i: {} for i in dict_idx}
+
+    def _batch(chunk: list[tuple]):
+        arrays = []
+        for i, values in enumerate(zip(*chunk)):
+            if i in dict_idx:
+                codes = vocab[i]
+                indices = pa.array([codes.setdefault(v, len(codes)) for v in values], pa.int32())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(list(codes), pa.string())))
+            else:
+                arrays.append(pa.array(values, schema.field(i).type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, schema)
+        write  = writer.write_batch
+    else:
+        options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        writer  = pa.ipc.new_file(path, schema, options=options)
+        write   = writer.write_batch
+
+    n_rows = 0
+    rows = iter(rows)
+    try:
+        for chunk in iter(lambda: list(islice(rows, ARROW_BATCH_ROWS)), []):
+            write(_batch(chunk))
+            n_rows += len(chunk)
+    finally:
+        writer.close()
+
+    print(f"  {fmt.upper()} -> {path}  ({n_rows} rows)")
+    return True
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  XLSX WRITER
+# ══════════════════════════════════════════════════════════════════════════════
+
+_HEADER_FILL  = PatternFill("solid", start_color="2F5496")
+_HEADER_FONT  = Font(name="Arial", bold=True, color="FFFFFF", size=11)
+_HEADER_ALIGN = Alignment(horizontal="center", vertical="center", wrap_text=True)
+_CELL_FONT    = Font(name="Arial", size=10)
+_ALIGN_L      = Alignment(horizontal="left",   vertical="center")
+_ALIGN_C      = Alignment(horizontal="center", vertical="center")
+_ODD_FILL     = PatternFill("solid", start_color="EEF2F9")
+_EVEN_FILL    = PatternFill("solid", start_color="FFFFFF")
+_THIN         = Side(style="thin", color="BFBFBF")
+_BORDER       = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+
+
+def _add_named_styles(wb: openpyxl.Workbook) -> None:
+    """
+    Register every cell style the writer uses once per workbook.  Cells then
+    only carry a reference to a named style instead of their own font, fill,
+    border and alignment objects.
+    """
+    bold_font = Font(name="Arial", size=10, bold=True)
+    styles = [
+        NamedStyle("header",     font=_HEADER_FONT, fill=_HEADER_FILL, border=_BORDER, alignment=_HEADER_ALIGN),
+        NamedStyle("odd_left",   font=_CELL_FONT,   fill=_ODD_FILL,    border=_BORDER, alignment=_ALIGN_L),
+        NamedStyle("odd_center", font=_CELL_FONT,   fill=_ODD_FILL,    border=_BORDER, alignment=_ALIGN_C),
+        NamedStyle("even_left",  font=_CELL_FONT,   fill=_EVEN_FILL,   border=_BORDER, alignment=_ALIGN_L),
+        NamedStyle("even_center", font=_CELL_FONT,  fill=_EVEN_FILL,   border=_BORDER, alignment=_ALIGN_C),
+        NamedStyle("sum_title",  font=Font(name="Arial", bold=True, size=11)),
+        NamedStyle("sum_left",   font=_CELL_FONT, border=_BORDER, alignment=_ALIGN_L),
+        NamedStyle("sum_center", font=_CELL_FONT, border=_BORDER, alignment=_ALIGN_C),
+        NamedStyle("sum_total_left",   font=bold_font, border=_BORDER, alignment=_ALIGN_L),
+        NamedStyle("sum_total_center", font=bold_font, border=_BORDER, alignment=_ALIGN_C),
+    ]
+    for style in styles:
+        wb.add_named_style(style)
+
+
+def _styled(ws, value, style: str) -> WriteOnlyCell:
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def _col_width(col: int, header: str, rows: list[tuple]) -> float:
+    max_len = len(header)
+    for row in rows:
+        val = row[col]
+        if val:
+            max_len = max(max_len, len(str(val)))
+    return min(max_len + 4, 60)
+
+
+def _imbalance_rows(header: str, counts: Counter) -> list[tuple]:
+    """Class-imbalance statistics for one level (images outside it excluded)."""
+    sizes = [n for val, n in counts.items() if val != "(none)"]
+    if not sizes:
+        return []
+    total   = sum(sizes)
+    entropy = -sum(n / total * math.log(n / total) for n in sizes)
+    return [
+        (f"{header} imbalance  =  classes",            len(sizes)),
+        (f"{header} imbalance  =  smallest class",     min(sizes)),
+        (f"{header} imbalance  =  largest class",      max(sizes)),
+        (f"{header} imbalance  =  largest / smallest", round(max(sizes) / min(sizes), 2)),
+        (f"{header} imbalance  =  normalised entropy",
+         round(entropy / math.log(len(sizes)), 3) if len(sizes) > 1 else 1.0),
+    ]
+
+
+def build_summary(tally: Counter, lbl_headers: list[str]) -> list[tuple]:
+    """
+    Summary rows, all marginalised from the label-combination tally gathered
+    while the rows streamed: per-level breakdowns, a cross-tab of every pair
+    of adjacent levels (level_1 × level_2, …) and class-imbalance statistics.
+    The cost depends on the number of leaf folders, not on the image count.
+    """
+    summary: list[tuple] = [("Total images", sum(tally.values()))]
+
+    marginals: list[Counter] = []
+    for j, header in enumerate(lbl_headers):
+        counts: Counter = Counter()
+        for combo, n in tally.items():
+            counts[combo[j] or "(none)"] += n
+        marginals.append(counts)
+        for val, count in sorted(counts.items()):
+            summary.append((f"{header}  =  {val}", count))
+
+    for j in range(len(lbl_headers) - 1):
+        pairs: Counter = Counter()
+        for combo, n in tally.items():
+            pairs[(combo[j] or "(none)", combo[j + 1] or "(none)")] += n
+        crosstab = f"{lbl_headers[j]} × {lbl_headers[j + 1]}"
+        for (outer, inner), count in sorted(pairs.items()):
+            summary.append((f"{crosstab}  =  {outer} / {inner}", count))
+
+    for header, counts in zip(lbl_headers, marginals):
+        summary += _imbalance_rows(header, counts)
+    return summary
+
+
+def _write_summary_sheet(wb: openpyxl.Workbook, summary: list[tuple]) -> None:
+    ws = wb.create_sheet("Summary")
+    ws.column_dimensions["A"].width = 35
+    ws.column_dimensions["B"].width = 14
+    ws.append([_styled(ws, "Breakdown", "sum_title"), _styled(ws, "Count", "sum_title")])
+
+    prev_group = None
+    for label, value in summary:
+        group = label.split("  =  ")[0] if "  =  " in label else None
+        if group and group != prev_group and prev_group is not None:
+            ws.append([])   # blank spacer row
+        prev_group = group
+        prefix = "sum_total" if label == "Total images" else "sum"
+        ws.append([_styled(ws, label, f"{prefix}_left"), _styled(ws, value, f"{prefix}_center")])
+
+
+def _new_dataset_sheet(wb: openpyxl.Workbook, title: str, all_headers: list[str],
+                       head: list[tuple]):
+    ws = wb.create_sheet(title)
+
+    # Sheet-level settings must be in place before the first row is appended
+    ws.row_dimensions[1].height = 28
+    for col_idx, header in enumerate(all_headers, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = _col_width(col_idx - 1, header, head)
+    ws.freeze_panes = "A2"
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(all_headers))}1"
+
+    ws.append([_styled(ws, header, "header") for header in all_headers])
+    return ws
+
+
+def _write_table_sheet(wb: openpyxl.Workbook, title: str, headers: list[str],
+                       rows: list[tuple]) -> None:
+    """A small banded sheet (e.g. Duplicates) written after the Summary."""
+    ws = wb.create_sheet(title)
+    for col_idx, header in enumerate(headers, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = _col_width(col_idx - 1, header, rows[:500])
+    ws.freeze_panes = "A2"
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}1"
+    ws.append([_styled(ws, header, "header") for header in headers])
+    for row_idx, record in enumerate(rows, start=2):
+        style = "odd_center" if row_idx % 2 == 1 else "even_center"
+        ws.append([_styled(ws, value, style) for value in record])
+
+
+def write_xlsx(rows, all_headers, summary, path,
+               rows_per_sheet: int = EXCEL_MAX_ROWS - 1, split: str = "sheets",
+               extra_sheets: list[tuple] = ()):
+    """
+    Stream rows into write-only workbooks: each row is flushed to disk as it
+    is appended, so time and memory stay flat for million-row datasets.
+    Install lxml for the fastest openpyxl serialisation.
+
+    Rows beyond `rows_per_sheet` (capped at Excel's limit) go to Dataset_1,
+    Dataset_2, … sheets, or with split="files" to <stem>_1.xlsx, <stem>_2.xlsx, …
+    Every workbook gets the Summary sheet (`summary` from `build_summary`,
+    covering the full dataset), followed
+    by any `extra_sheets` given as (title, headers, rows).
+    Returns the paths of the workbooks written.
+    """
+    rows_per_sheet = max(1, min(rows_per_sheet, EXCEL_MAX_ROWS - 1))
+    rows = iter(rows)
+    head = list(islice(rows, 500))   # sample for column widths
+    records = chain(head, rows)
+
+    n_shards = max(1, -(-summary[0][1] // rows_per_sheet))
+    stem, ext = os.path.splitext(path)
+
+    # path slot is left-aligned; everything else centre-aligned
+    odd_styles  = ["odd_left"  if i == 1 else "odd_center"  for i in range(len(all_headers))]
+    even_styles = ["even_left" if i == 1 else "even_center" for i in range(len(all_headers))]
+
+    written: list[str] = []
+
+    def _save(wb: openpyxl.Workbook, out_path: str, n_rows: int, n_sheets: int) -> None:
+        _write_summary_sheet(wb, summary)
+        for title, headers, sheet_rows in extra_sheets:
+            _write_table_sheet(wb, title, headers, sheet_rows)
+        wb.save(out_path)
+        written.append(out_path)
+        sheets = f", {n_sheets} sheets" if n_sheets > 1 else ""
+        print(f"  XLSX -> {out_path}  ({n_rows} rows, {len(all_headers)} columns{sheets})")
+
+    wb = None
+    wb_rows = wb_sheets = 0
+    for shard in range(1, n_shards + 1):
+        if wb is None:
+            wb = openpyxl.Workbook(write_only=True)
+            _add_named_styles(wb)
+            wb_rows = wb_sheets = 0
+
+        title = "Dataset" if n_shards == 1 else f"Dataset_{shard}"
+        ws = _new_dataset_sheet(wb, title, all_headers, head)
+        wb_sheets += 1
+        for row_idx, record in enumerate(islice(records, rows_per_sheet), start=2):
+            styles = odd_styles if row_idx % 2 == 1 else even_styles
+            ws.append([_styled(ws, value, style) for value, style in zip(record, styles)])
+            wb_rows += 1
+
+        if split == "files":
+            _save(wb, path if n_shards == 1 else f"{stem}_{shard}{ext}", wb_rows, wb_sheets)
+            wb = None
+
+    if wb is not None:
+        _save(wb, path, wb_rows, wb_sheets)
+    return written
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  OUTPUT PIPELINE
+# ══════════════════════════════════════════════════════════════════════════════
+
+def write_outputs(rows: Iterable[tuple], headers: list[str], label_idx: list[int],
+                  out_stem: str, formats=("csv", "xlsx"), tally_idx: list[int] | None = None,
+                  int_idx: list[int] = (), rows_per_sheet: int = EXCEL_MAX_ROWS - 1,
+                  xlsx_split: str = "sheets", extra_sheets: list[tuple] = (),
+                  split_names: list[str] | None = None, strata: list[tuple] = (),
+                  previous_outputs: Iterable[str] = ()):
+    """
+    Stream `rows` (tuples in `headers` order) to every requested format.
+
+    Rows go to the CSV once, with the label tally gathered on the way; the
+    other formats are then fed back from that CSV, so no full row list is
+    held.  The CSV is streamed into <stem>.csv.tmp and only moved onto
+    <stem>.csv once complete, so a run that finds no rows (or dies part-way)
+    leaves the previous outputs as they were.  If "csv" is not among
+    `formats` the temp file is removed afterwards.  `tally_idx` defaults to
+    `label_idx`; when the split slot is appended to it, pass `split_names`
+    and `strata` to add the split breakdown to the Summary.
+    Workbooks of this stem among `previous_outputs` (a manifest's "outputs")
+    that this run didn't rewrite are removed, so fewer shards or a change of
+    `xlsx_split` leave no stale <stem>_N.xlsx behind.
+    Returns (number of rows, paths written).
+    """
+    tmp_path = out_stem + ".csv.tmp"
+    tally: Counter = Counter()
+    try:
+        n_rows = write_csv(tally_rows(rows, tally_idx or label_idx, tally), headers, tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if not n_rows:
+        os.remove(tmp_path)
+        return 0, []
+    csv_path = tmp_path
+    if "csv" in formats:
+        csv_path = out_stem + ".csv"
+        os.replace(tmp_path, csv_path)
+        print(f"  CSV  -> {csv_path}  ({n_rows} rows)")
+
+    summary = build_summary(tally, [headers[i] for i in label_idx])
+    if split_names:
+        split_rows, n_empty = split_summary(tally, split_names, strata)
+        summary += split_rows
+        print("  Split   : " + ", ".join(f"{name} {n}" for name, (_, n) in zip(split_names, split_rows)))
+        if n_empty:
+            print(f"  Warning : {n_empty} stratum(s) got no images in at least one split "
+                  f"— too few images for the ratios.")
+
+    outputs = [csv_path] if "csv" in formats else []
+    if "xlsx" in formats:
+        outputs += write_xlsx(read_csv_rows(csv_path, int_idx), headers, summary,
+                              out_stem + ".xlsx", rows_per_sheet, xlsx_split, extra_sheets)
+    for fmt in ("parquet", "arrow"):
+        path = out_stem + OUTPUT_FORMATS[fmt]
+        if fmt in formats and write_columnar(read_csv_rows(csv_path, int_idx), headers,
+                                             label_idx, path, fmt, int_idx):
+            outputs.append(path)
+    if "csv" not in formats:
+        os.remove(csv_path)
+
+    out_dir, stem = os.path.split(out_stem)
+    workbook = re.compile(re.escape(stem) + r"(_\d+)?\.xlsx")
+    for path in previous_outputs:
+        # Only this stem's workbooks, in the folder being written
+        if (path not in outputs and os.path.dirname(path) == out_dir
+                and workbook.fullmatch(os.path.basename(path)) and os.path.exists(path)):
+            os.remove(path)
+            print(f"  Removed stale {path}")
+    return n_rows, outputs
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  BENCHMARK
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _make_synthetic_tree(root: str, n_files: int) -> None:
+    """Create an uneven 3-level tree of empty .jpg files under `root`."""
+    n_written = 0
+    a = 0
+    while n_written < n_files:
+        for b in range(5 + a % 20):              # uneven fan-out per level_1 folder
+            leaf = os.path.join(root, f"class_{a:03d}", f"group_{b:02d}", "imgs")
+            os.makedirs(leaf, exist_ok=True)
+            for i in range(min(250 * (1 + b % 4), n_files - n_written)):
+                open(os.path.join(leaf, f"{i:06d}.jpg"), "wb").close()
+                n_written += 1
+            if n_written >= n_files:
+                break
+        a += 1
+
+
+def benchmark_scan(n_files: int = 500_000, jobs_list=(1, 4, 16),
+                   bench_dir: str | None = None) -> None:
+    """
+    Time `scan_tree` on a synthetic tree of `n_files` images for each worker
+    count in `jobs_list`, then `scan_fixed_depth` on the same tree.  Put
+    `bench_dir` on the filesystem you care about (e.g. an NFS mount) — on a
+    local SSD with a warm cache the listing is not latency-bound and extra
+    workers help little.
+    """
+    root = tempfile.mkdtemp(prefix="labeler_bench_", dir=bench_dir)
+    try:
+        print(f"Building synthetic tree with {n_files} files in {root} …")
+        t0 = time.perf_counter()
+        _make_synthetic_tree(root, n_files)
+        print(f"  built in {time.perf_counter() - t0:.1f}s\n")
+
+        reference = None
+        walkers = [(f"auto   jobs={jobs:<3d}", partial(scan_tree, root, jobs=jobs))
+                   for jobs in jobs_list]
+        walkers.append(("fixed  depth=3 ", partial(scan_fixed_depth, root, 3)))
+        for name, walk in walkers:
+            t0 = time.perf_counter()
+            found = list(walk())
+            elapsed = time.perf_counter() - t0
+            if reference is None:
+                reference = found
+            same = "identical" if found == reference else "ORDER MISMATCH"
+            print(f"  {name}  {len(found)} images  {elapsed:7.2f}s  ({same})")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -1,29 +1,140 @@
 import os
+import pymupdf
 import pymupdf.layout          # Activate improved layout analysis (must come before pymupdf4llm)
 import pymupdf4llm
 from pathlib import Path
 from tqdm import tqdm
 import argparse
 import shutil
+from collections import Counter
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
+import conversion_cache
 
-def convert_pdf_to_md(pdf_path: Path, md_path: Path) -> bool:
+# pymupdf4llm.to_markdown settings; also part of the conversion cache key, so
+# changing any of them re-converts instead of reusing stale output
+TO_MARKDOWN_OPTIONS = {
+    "page_chunks": False,               # whole document
+    "write_images": False,              # no image extraction
+    "ignore_images": True,
+    "ignore_graphics": True,
+    "show_progress": False,
+    "margins": (36, 40, 36, 40),        # balanced margins
+    "table_strategy": "lines_strict",   # good balance for academic tables
+    # "hdr_info": None,                 # uncomment if header detection is too aggressive
+}
+
+# Bumped when the output for unchanged options changes (a fix in this script),
+# so the cache stops serving what the old code produced
+CACHE_REVISION = 2
+
+SPLIT_MIN_PAGES = 200   # longer documents are converted as parallel page ranges
+CHUNK_PAGES     = 25    # pages per range
+
+
+def _layout_options() -> tuple[dict, dict]:
+    """
+    (parse_document kwargs, ParsedDocument.to_markdown kwargs) exactly as
+    pymupdf4llm.to_markdown's layout path would use them for
+    TO_MARKDOWN_OPTIONS: its own defaults (force_text, use_ocr, dpi, …)
+    overlaid with ours, so a range conversion parses every page the same way.
+    """
+    import inspect
+    params = inspect.signature(pymupdf4llm._layout_to_markdown).parameters
+    opts = {name: p.default for name, p in params.items() if p.default is not inspect.Parameter.empty}
+    opts.update((k, v) for k, v in TO_MARKDOWN_OPTIONS.items() if k in opts)
+
+    parse = {
+        "filename":           opts["filename"],
+        "image_dpi":          opts["dpi"],
+        "image_format":       opts["image_format"],
+        "image_path":         opts["image_path"],
+        "ocr_dpi":            opts["ocr_dpi"],
+        "write_images":       opts["write_images"],
+        "embed_images":       opts["embed_images"],
+        "show_progress":      False,
+        "force_text":         opts["force_text"],
+        "use_ocr":            opts["use_ocr"],
+        "force_ocr":          opts["force_ocr"],
+        "ocr_language":       opts["ocr_language"],
+        "ocr_function":       opts["ocr_function"],
+        "render_html_tables": opts["render_html_tables"],
+        "edge_threshold":     opts["edge_threshold"],
+    }
+    render = {
+        "header":          opts["header"],
+        "footer":          opts["footer"],
+        "write_images":    opts["write_images"],
+        "embed_images":    opts["embed_images"],
+        "ignore_code":     opts["ignore_code"],
+        "show_progress":   False,
+        "page_separators": opts["page_separators"],
+        "page_chunks":     opts["page_chunks"],
+    }
+    return parse, render
+
+
+def _parse_page_range(pdf_path: str, pages: list[int], parse_options: dict):
+    """Process-pool worker: run pymupdf4llm's layout parser on one page range."""
+    from pymupdf4llm.helpers.document_layout import parse_document
+    return parse_document(pdf_path, pages=pages, **parse_options)
+
+
+def convert_page_ranges(pdf_path: Path, n_pages: int, pool: ProcessPoolExecutor) -> str:
+    """
+    Markdown for a long PDF, parsed in CHUNK_PAGES ranges on `pool`.
+
+    The expensive layout parsing runs per range; the parsed pages are then
+    joined in order and rendered once.  Header levels are ranked by font size
+    across the whole document, so they are re-assigned over the joined pages
+    before rendering, and tables never straddle a range because they are
+    detected per page.  The result matches a whole-document conversion.
+    """
+    from pymupdf4llm.helpers.document_layout import update_header_tags
+
+    parse_options, render_options = _layout_options()
+    ranges = [list(range(a, min(a + CHUNK_PAGES, n_pages))) for a in range(0, n_pages, CHUNK_PAGES)]
+    parts  = list(pool.map(_parse_page_range, repeat(str(pdf_path)), ranges, repeat(parse_options)))
+
+    document = parts[0]
+    for part in parts[1:]:
+        document.pages.extend(part.pages)
+    header_sizes = {
+        box.max_fontsize
+        for page in document.pages for box in page.boxes
+        if box.boxclass in ("title", "section-header")
+    }
+    if header_sizes:
+        update_header_tags(document.pages, header_sizes)
+
+    return document.to_markdown(**render_options)
+
+
+def convert_pdf_to_md(pdf_path: Path, md_path: Path,
+                      page_pool: ProcessPoolExecutor | None = None,
+                      split_pages: int = SPLIT_MIN_PAGES) -> bool:
     """
     Convert one PDF to Markdown (text only, no images).
+    With a `page_pool`, documents over `split_pages` pages are converted as
+    parallel page ranges (layout engine only; see `convert_page_ranges`).
     Returns True if successful.
     """
     try:
-        md_text = pymupdf4llm.to_markdown(
-            pdf_path,
-            page_chunks=False,              # whole document
-            write_images=False,             # no image extraction
-            ignore_images=True,
-            ignore_graphics=True,
-            show_progress=False,
-            margins=(36, 40, 36, 40),       # balanced margins
-            table_strategy="lines_strict",  # good balance for academic tables
-            # hdr_info=None,                # uncomment if header detection is too aggressive
-        )
+        md_text = None
+        if page_pool is not None and getattr(pymupdf4llm, "_use_layout", False):
+            with pymupdf.open(pdf_path) as doc:
+                n_pages = doc.page_count
+            if n_pages > split_pages:
+                print(f"  ⇶ {pdf_path.name}: {n_pages} pages in ranges of {CHUNK_PAGES}")
+                try:
+                    md_text = convert_page_ranges(pdf_path, n_pages, page_pool)
+                except Exception as e:      # pymupdf4llm internals moved, or a page worker died
+                    print(f"  ! Page-range conversion failed ({e!r}), converting whole")
+
+        if md_text is None:
+            md_text = pymupdf4llm.to_markdown(pdf_path, **TO_MARKDOWN_OPTIONS)
 
         # Ensure target parent folder exists
         md_path.parent.mkdir(parents=True, exist_ok=True)
@@ -37,6 +148,54 @@ def convert_pdf_to_md(pdf_path: Path, md_path: Path) -> bool:
         return False
 
 
+def pool_broken(pool: ProcessPoolExecutor) -> bool:
+    """True once a worker of `pool` has died; from then on every submit raises BrokenProcessPool."""
+    try:
+        pool.submit(int).result()
+    except BrokenProcessPool:
+        return True
+    return False
+
+
+def page_count(pdf_path: Path) -> int:
+    """Number of pages, or 0 if the PDF can't be opened."""
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+
+def convert_cached(pdf_path: Path, md_path: Path, cache_dir: Path | None,
+                   link: bool = True, page_pool: ProcessPoolExecutor | None = None,
+                   split_pages: int = SPLIT_MIN_PAGES) -> str:
+    """
+    `convert_pdf_to_md` through the shared conversion cache: the same PDF
+    content converted before with the same pymupdf4llm version and options
+    is hardlinked (or copied) from the cache instead.
+    Returns "cached", "converted" or "failed".
+    """
+    key = None
+    if cache_dir is not None:
+        try:
+            key = conversion_cache.cache_key(
+                pdf_path, "pymupdf4llm",
+                conversion_cache.package_version("pymupdf4llm", "pymupdf"),
+                {**TO_MARKDOWN_OPTIONS, "cache_revision": CACHE_REVISION},
+            )
+            if conversion_cache.materialize(key, md_path, cache_dir, link):
+                return "cached"
+        except OSError as e:
+            print(f"  ! Cache unavailable for {pdf_path.name}  →  {e}")
+            key = None
+
+    if not convert_pdf_to_md(pdf_path, md_path, page_pool, split_pages):
+        return "failed"
+    if key:
+        conversion_cache.store(key, md_path, cache_dir)
+    return "converted"
+
+
 def main():
     parser = argparse.ArgumentParser(description="Convert research PDFs to clean Markdown – saved in Papers_Converted")
     parser.add_argument(
@@ -50,6 +209,46 @@ def main():
         action="store_true",
         help="Only show what would be converted (no files written)",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=str(conversion_cache.DEFAULT_CACHE_DIR),
+        help="Conversion cache shared with pdf_to_md.py (default: %(default)s, or $PDF_MD_CACHE_DIR)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Convert everything without reading or filling the conversion cache",
+    )
+    parser.add_argument(
+        "--cache-copy",
+        action="store_true",
+        help="Copy cache hits instead of hardlinking them",
+    )
+    parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=0,
+        help="Trim the cache to this size after the run, least recently used first",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Convert this many PDFs at once in separate processes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--split-pages",
+        type=int,
+        default=SPLIT_MIN_PAGES,
+        help="Convert PDFs longer than this as parallel page ranges (default: %(default)s, 0 = never)",
+    )
+    parser.add_argument(
+        "--page-workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes for page-range conversion (default: %(default)s)",
+    )
     args = parser.parse_args()
 
     source_root = Path(args.root).resolve()
@@ -69,11 +268,16 @@ def main():
 
     print(f"Found {len(pdf_files)} PDF files.\n")
 
-    success = 0
+    cache_dir = None if args.no_cache else Path(args.cache_dir).expanduser()
+    # Worker processes only start once a long document needs them
+    page_pool = ProcessPoolExecutor(args.page_workers) if args.split_pages > 0 else None
+
+    counts: Counter = Counter()
     skipped = 0
-    failed = 0
+    todo: list[tuple[Path, Path]] = []
+    progress = tqdm(total=len(pdf_files), desc="Converting", unit="paper")
 
-    for pdf_path in tqdm(pdf_files, desc="Converting", unit="paper"):
+    for pdf_path in pdf_files:
         # Compute relative path from source root
         rel_path = pdf_path.relative_to(source_root)
 
@@ -83,34 +287,80 @@ def main():
         if target_md_path.exists():
             print(f"  - Skipped (already exists): {rel_path}")
             skipped += 1
+            progress.update()
             continue
 
         if args.dry_run:
             print(f"  Would convert: {rel_path} → {target_md_path.relative_to(target_root)}")
+            progress.update()
             continue
 
         # Optional: copy folder structure early (nice for partial runs)
         target_md_path.parent.mkdir(parents=True, exist_ok=True)
+        todo.append((pdf_path, target_md_path))
+
+    if args.workers > 1 and len(todo) > 1:
+        # Long documents are held back and afterwards get every core to
+        # themselves through the page pool, one at a time.
+        long_docs = []
+        if page_pool is not None:
+            long_docs = [task for task in todo if page_count(task[0]) > args.split_pages]
+            todo = [task for task in todo if task not in long_docs]
+
+        with ProcessPoolExecutor(args.workers) as pool:
+            futures = {
+                pool.submit(convert_cached, pdf_path, md_path, cache_dir, not args.cache_copy): pdf_path
+                for pdf_path, md_path in todo
+            }
+            for fut in as_completed(futures):
+                try:
+                    outcome = fut.result()
+                except Exception as e:          # e.g. a worker killed by a crash in MuPDF
+                    print(f"  ✗ Failed: {futures[fut].name}  →  {e!r}")
+                    outcome = "failed"
+                counts[outcome] += 1
+                progress.update()
+        todo = long_docs
 
-        ok = convert_pdf_to_md(pdf_path, target_md_path)
-        if ok:
-            success += 1
-            # print(f"  ✓ {rel_path} → {target_md_path.name}")  # uncomment for verbose
-        else:
-            failed += 1
+    for pdf_path, md_path in todo:
+        counts[convert_cached(pdf_path, md_path, cache_dir, not args.cache_copy,
+                              page_pool, args.split_pages)] += 1
+        progress.update()
+        # A crashed page worker breaks the pool for good: replace it so the
+        # next long document still gets page ranges
+        if (page_pool is not None and page_count(pdf_path) > args.split_pages
+                and pool_broken(page_pool)):
+            print("  ! A page worker died, starting a new page pool")
+            page_pool.shutdown(wait=False)
+            page_pool = ProcessPoolExecutor(args.page_workers)
+        # print(f"  ✓ {pdf_path.name} → {md_path.name}")  # uncomment for verbose
+    progress.close()
+
+    if page_pool is not None:
+        page_pool.shutdown()
+
+    success = counts["converted"] + counts["cached"]
+    cached  = counts["cached"]
+    failed  = counts["failed"]
 
     print("\n" + "═" * 70)
     print("Conversion finished:")
     print(f"  • Successfully converted : {success:3d}")
+    print(f"    of which from cache    : {cached:3d}")
     print(f"  • Skipped (already exist) : {skipped:3d}")
     print(f"  • Failed                  : {failed:3d}")
     print(f"  • Total processed         : {len(pdf_files):3d}")
     print("═" * 70)
 
+    if cache_dir is not None and args.cache_max_gb > 0:
+        removed, freed = conversion_cache.prune(int(args.cache_max_gb * 1024 ** 3), cache_dir)
+        if removed:
+            print(f"Cache trimmed: {removed} entries, {freed / 1024 ** 2:.1f} MB freed")
+
     if success > 0:
         print(f"Markdown files are in: {target_root}")
         print("You can now feed them to your local LLM.\n")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,16 +1,41 @@
 import os
+import io
+import re
+import csv
+import json
 import requests
 from tqdm import tqdm
 import time
 import shutil
+import hashlib
+import asyncio
+import importlib.util
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager, asynccontextmanager, nullcontext, redirect_stdout
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 # ===============================
 # CONFIG
 # ===============================
 
 BASE_DIR = os.path.expanduser("~/Downloads/Papers")
-DELAY_BETWEEN_DOWNLOADS = 1  # seconds
+DELAY_BETWEEN_DOWNLOADS = 1  # seconds between request starts to the same host
 MAX_RETRIES = 3
+MAX_WORKERS = 8              # downloads in flight overall
+MAX_PER_HOST = 2             # downloads in flight per host (arxiv.org asks for politeness)
+MIN_CHUNK = 64 * 1024        # read/write size bounds; scaled to the file size in between
+MAX_CHUNK = 1024 * 1024
+MANIFEST_NAME = ".papers_manifest.json"
+MANIFEST_VERSION = 1
+MANIFEST_SAVE_EVERY = 20     # entries recorded between manifest writes
+PDF_PROBE_BYTES = 1024       # how far from each end to look for %PDF / %%EOF
+PART_META_SUFFIX = ".json"   # <file>.part.json: validators of the response a .part came from
 
 # ===============================
 # PAPER STRUCTURE
@@ -87,125 +112,970 @@ papers = {
 # UTILITIES
 # ===============================
 
+_UNSAFE_CHARS = str.maketrans("", "", r'\/:*?"<>|')
+
+
 def sanitize_filename(name):
-    return "".join(c for c in name if c not in r'\/:*?"<>|').strip()
+    return name.translate(_UNSAFE_CHARS).strip()
 
 
-def download_file(session, url, filepath):
-    temp_path = filepath + ".part"
+class HostLimiter:
+    """
+    Per-host politeness for concurrent downloads: at most `max_per_host`
+    requests in flight to one host, and request starts to the same host at
+    least `min_interval` seconds apart.  Other hosts are not held up.
+    """
+
+    def __init__(self, max_per_host=MAX_PER_HOST, min_interval=DELAY_BETWEEN_DOWNLOADS):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._slots = {}        # host -> BoundedSemaphore
+        self._next_start = {}   # host -> earliest monotonic time for the next request
+
+    @contextmanager
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._slots.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.min_interval
+            time.sleep(start - now)
+            yield
+
+
+class AsyncHostLimiter:
+    """HostLimiter for the asyncio backend (a single event loop, so no locking)."""
+
+    def __init__(self, max_per_host=MAX_PER_HOST, min_interval=DELAY_BETWEEN_DOWNLOADS):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._slots = {}        # host -> asyncio.Semaphore
+        self._next_start = {}   # host -> earliest monotonic time for the next request
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = urlsplit(url).netloc
+        semaphore = self._slots.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        async with semaphore:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+            await asyncio.sleep(start - now)
+            yield
+
+
+_thread_state = threading.local()
+
+
+def thread_session():
+    """One requests.Session per worker thread (Session is not thread-safe)."""
+    if not hasattr(_thread_state, "session"):
+        _thread_state.session = requests.Session()
+    return _thread_state.session
+
+
+def pdf_problem(path):
+    """
+    Cheap sanity check of a downloaded PDF: the %PDF header near the start
+    and the %%EOF trailer near the end.  Returns "" if both are present,
+    otherwise what is wrong (an HTML error page, a truncated transfer, …).
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head = f.read(PDF_PROBE_BYTES)
+            f.seek(max(0, size - PDF_PROBE_BYTES))
+            tail = f.read()
+    except OSError as e:
+        return str(e)
+    if b"%PDF-" not in head:
+        if head.lstrip()[:1] == b"<":
+            return "HTML/XML page, not a PDF"
+        return "no %PDF header"
+    if b"%%EOF" not in tail:
+        return "no %%EOF trailer (truncated?)"
+    return ""
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(MAX_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    What each downloaded file is, kept in <dest>/.papers_manifest.json and
+    keyed by path relative to <dest>:
+      {"url", "size", "mtime_ns", "sha256", "etag", "last_modified"}
+
+    A file whose size and mtime still match its entry is trusted without
+    reading it; otherwise (or with full=True) it is re-hashed.  The ETag and
+    Last-Modified validators let a re-run ask the server whether a paper
+    changed without downloading it again.  Safe to update from many threads.
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        self.entries = manifest.get("files", {}) if manifest.get("version") == MANIFEST_VERSION else {}
+
+    def _key(self, filepath):
+        return os.path.relpath(filepath, self.base_dir).replace(os.sep, "/")
+
+    def get(self, filepath):
+        with self._lock:
+            return self.entries.get(self._key(filepath))
+
+    def alias(self, filepath, source):
+        """Record `filepath` as a link or copy of the already recorded `source`."""
+        with self._lock:
+            entry = self.entries.get(self._key(source))
+            if entry:
+                self.entries[self._key(filepath)] = dict(entry)
+                self._unsaved += 1
+
+    def drop(self, filepath):
+        with self._lock:
+            self.entries.pop(self._key(filepath), None)
+
+    def record(self, filepath, url, etag=None, last_modified=None):
+        """Hash the file now at `filepath` and store its entry."""
+        st = os.stat(filepath)
+        entry = {
+            "url":           url,
+            "size":          st.st_size,
+            "mtime_ns":      st.st_mtime_ns,
+            "sha256":        file_sha256(filepath),
+            "etag":          etag,
+            "last_modified": last_modified,
+        }
+        with self._lock:
+            self.entries[self._key(filepath)] = entry
+            self._unsaved += 1
+            save = self._unsaved >= MANIFEST_SAVE_EVERY
+        if save:
+            self.save()
+
+    def verify(self, filepath, url, full=False):
+        """
+        Check an existing file against its entry.  Returns "" if it is good,
+        otherwise why it needs fetching again.  A good file with no entry
+        (downloaded before the manifest existed) is adopted.
+        """
+        entry = self.get(filepath)
+        if entry is None:
+            problem = pdf_problem(filepath)
+            if not problem:
+                self.record(filepath, url)
+            return problem
+        if entry["url"] != url:
+            return "URL changed in the paper list"
+
+        st = os.stat(filepath)
+        if st.st_size != entry["size"]:
+            return f"size changed ({entry['size']} → {st.st_size} bytes)"
+        if full or st.st_mtime_ns != entry["mtime_ns"]:
+            if file_sha256(filepath) != entry["sha256"]:
+                return "SHA-256 does not match the manifest"
+            problem = pdf_problem(filepath)
+            if problem:
+                return problem
+            with self._lock:
+                entry["mtime_ns"] = st.st_mtime_ns
+        return ""
+
+    def save(self):
+        with self._lock:
+            manifest = {"version": MANIFEST_VERSION, "files": dict(self.entries)}
+            self._unsaved = 0
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def _conditional_headers(manifest, filepath):
+    """If-None-Match / If-Modified-Since for a file that is already in place."""
+    entry = manifest.get(filepath) if manifest and os.path.exists(filepath) else None
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _complete_download(temp_path, filepath, url, response_headers, manifest):
+    """
+    Move a finished `.part` into place once it passes `pdf_problem`, and
+    record it in the manifest.  A bad body is discarded (resuming it would
+    only append to garbage) and raises.
+    """
+    problem = pdf_problem(temp_path)
+    if problem:
+        _discard_part(temp_path)
+        raise IOError(f"downloaded file is not a valid PDF: {problem}")
+    os.replace(temp_path, filepath)
+    _discard_part(temp_path)        # the validators sidecar
+    if manifest:
+        manifest.record(filepath, url, response_headers.get("etag"),
+                        response_headers.get("last-modified"))
+
+
+def _chunk_size(length):
+    """Read/write size for a body of `length` bytes: about 64 chunks per file."""
+    return max(MIN_CHUNK, min(MAX_CHUNK, length // 64)) if length else MIN_CHUNK
+
 
+def _discard_part(temp_path):
+    """Remove a partial download and its validators sidecar."""
+    for path in (temp_path, temp_path + PART_META_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _load_part_meta(temp_path):
+    try:
+        with open(temp_path + PART_META_SUFFIX, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_part_meta(temp_path, url, response_headers):
+    """Remember which version of `url` a fresh .part holds, for a later If-Range."""
+    etag = response_headers.get("etag")
+    meta = {
+        "url":           url,
+        "etag":          etag if etag and not etag.startswith("W/") else None,  # If-Range needs a strong one
+        "last_modified": response_headers.get("last-modified"),
+        "length":        int(response_headers.get("content-length") or 0) or None,
+    }
+    with open(temp_path + PART_META_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _request_headers(url, filepath, temp_path, manifest):
+    """
+    (offset, headers) for the next attempt.  A partial file is resumed with a
+    Range request guarded by If-Range, carrying the validator of the response
+    it came from: if the server now has a different version it sends that
+    whole instead of splicing its tail onto ours.  A partial file with no
+    validator (or from another URL) can't be guarded and starts over.
+    """
     headers = {
         "User-Agent": "Mozilla/5.0"
     }
+    offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+    if offset:
+        meta = _load_part_meta(temp_path)
+        validator = meta.get("etag") or meta.get("last_modified")
+        if validator and meta.get("url") == url:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+            return offset, headers
+        _discard_part(temp_path)
+    headers.update(_conditional_headers(manifest, filepath))
+    return 0, headers
+
+
+def _resume_offset(status, response_headers, offset, temp_path, name):
+    """
+    Byte offset the response body starts at when resuming from `offset`:
+    `offset` for a matching 206, 0 when the whole file follows.  A 416, or a
+    Content-Range that starts elsewhere or belongs to a file of another
+    length, discards the partial file and raises.
+    """
+    if not offset:
+        return 0
+    if status == 416:
+        # Nothing satisfiable past our offset: the partial file is stale
+        _discard_part(temp_path)
+        raise IOError(f"416 for resume at byte {offset}, restarting")
+    if status != 206:
+        return 0            # 200: range ignored or If-Range failed (errors are raised by the caller)
+
+    content_range = response_headers.get("content-range", "")
+    match = re.fullmatch(r"bytes (\d+)-\d+/(\d+|\*)", content_range.strip())
+    length = _load_part_meta(temp_path).get("length")
+    if not match or int(match.group(1)) != offset:
+        _discard_part(temp_path)
+        raise IOError(f"Content-Range {content_range!r} does not resume at byte {offset}")
+    if length and match.group(2) != str(length):
+        _discard_part(temp_path)
+        raise IOError(f"Content-Range {content_range!r} is for a different file than the "
+                      f"{length}-byte one being resumed")
+    print(f"↻ Resuming {name} at {offset} bytes")
+    return offset
+
+
+def _attempt_failed(e, attempt, filepath, temp_path):
+    """Report a failed attempt; returns the back-off before the next one (None if last)."""
+    print(f"⚠ {os.path.basename(filepath)}: attempt {attempt+1}/{MAX_RETRIES} failed: {e}")
+
+    # 4xx other than 416 won't improve by resuming
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None and 400 <= status < 500:
+        _discard_part(temp_path)
+
+    if attempt < MAX_RETRIES - 1:
+        sleep_time = 2 ** attempt
+        print(f"   Retrying in {sleep_time}s...")
+        return sleep_time
+    return None
+
+
+def download_file(session, url, filepath, limiter=None, show_progress=True, manifest=None):
+    """
+    Download `url` to `filepath` via `filepath.part`, renamed into place when
+    complete.  A failed attempt keeps the partial file and the next attempt
+    (or the next run) asks only for the missing bytes with a Range request
+    (guarded by If-Range, see `_request_headers`); if the server answers
+    with the whole file instead, it starts over.
+
+    With a `manifest`, a file already in place is only replaced if the
+    server reports a newer version (conditional request), and a finished
+    download is recorded.  Returns "downloaded", "unchanged" or "failed".
+    """
+    temp_path = filepath + ".part"
 
     for attempt in range(MAX_RETRIES):
+        offset, headers = _request_headers(url, filepath, temp_path, manifest)
+
         try:
-            response = session.get(url, stream=True, headers=headers, timeout=30)
-            response.raise_for_status()
+            # The host slot is held for the transfer, not for the retry back-off
+            with limiter.slot(url) if limiter else nullcontext():
+                response = session.get(url, stream=True, headers=headers, timeout=30)
+                if response.status_code == 304:
+                    print(f"✔ Unchanged: {os.path.basename(filepath)}")
+                    return "unchanged"
+                offset = _resume_offset(response.status_code, response.headers,
+                                        offset, temp_path, os.path.basename(filepath))
+                response.raise_for_status()
+                if not offset:
+                    _save_part_meta(temp_path, url, response.headers)
+
+                length = int(response.headers.get("content-length", 0))
+                total = offset + length if length else 0
+                _stream_to_file(response, temp_path, offset, total if show_progress else 0,
+                                os.path.basename(filepath), _chunk_size(length))
 
-            total = int(response.headers.get("content-length", 0))
-
-            with open(temp_path, "wb") as file:
-                if total == 0:
-                    # Unknown size
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            file.write(chunk)
-                else:
-                    with tqdm(
-                        total=total,
-                        unit="iB",
-                        unit_scale=True,
-                        desc=os.path.basename(filepath),
-                    ) as bar:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                file.write(chunk)
-                                bar.update(len(chunk))
-
-            os.replace(temp_path, filepath)
+            _complete_download(temp_path, filepath, url, response.headers, manifest)
             print(f"✔ Downloaded: {os.path.basename(filepath)}")
-            return True
+            return "downloaded"
 
         except Exception as e:
-            print(f"⚠ Attempt {attempt+1}/{MAX_RETRIES} failed: {e}")
+            sleep_time = _attempt_failed(e, attempt, filepath, temp_path)
+            if sleep_time:
+                time.sleep(sleep_time)
 
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+    print(f"❌ Failed permanently: {url}")
+    return "failed"
 
-            if attempt < MAX_RETRIES - 1:
-                sleep_time = 2 ** attempt
-                print(f"   Retrying in {sleep_time}s...")
-                time.sleep(sleep_time)
+
+def _stream_to_file(response, temp_path, offset, total, desc, chunk_size=MIN_CHUNK):
+    """
+    Write the response body to `temp_path`, appending after `offset` bytes
+    (a resumed download) or from scratch, with a progress bar when `total`
+    is known.
+    """
+    with open(temp_path, "ab" if offset else "wb") as file:
+        if total == 0:
+            # Unknown size (or bars off: concurrent downloads would garble them)
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    file.write(chunk)
+        else:
+            with tqdm(
+                total=total,
+                initial=offset,
+                unit="iB",
+                unit_scale=True,
+                desc=desc,
+            ) as bar:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        file.write(chunk)
+                        bar.update(len(chunk))
+
+
+async def download_file_async(client, url, filepath, limiter=None, show_progress=True, manifest=None):
+    """
+    download_file for the asyncio backend: the same .part/Range resume and
+    retries, over a shared httpx.AsyncClient.
+    """
+    temp_path = filepath + ".part"
+
+    for attempt in range(MAX_RETRIES):
+        offset, headers = _request_headers(url, filepath, temp_path, manifest)
+
+        try:
+            async with limiter.slot(url) if limiter else nullcontext():
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304:
+                        print(f"✔ Unchanged: {os.path.basename(filepath)}")
+                        return "unchanged"
+                    offset = _resume_offset(response.status_code, response.headers,
+                                            offset, temp_path, os.path.basename(filepath))
+                    response.raise_for_status()
+                    if not offset:
+                        _save_part_meta(temp_path, url, response.headers)
+
+                    length = int(response.headers.get("content-length", 0))
+                    total = offset + length if length else 0
+                    await _stream_to_file_async(response, temp_path, offset, total if show_progress else 0,
+                                                os.path.basename(filepath), _chunk_size(length))
+
+            # Hashing for the manifest reads the whole file: keep it off the loop
+            await asyncio.to_thread(_complete_download, temp_path, filepath, url,
+                                    response.headers, manifest)
+            print(f"✔ Downloaded: {os.path.basename(filepath)}")
+            return "downloaded"
+
+        except Exception as e:
+            sleep_time = _attempt_failed(e, attempt, filepath, temp_path)
+            if sleep_time:
+                await asyncio.sleep(sleep_time)
 
     print(f"❌ Failed permanently: {url}")
-    return False
+    return "failed"
+
+
+async def _stream_to_file_async(response, temp_path, offset, total, desc, chunk_size=MIN_CHUNK):
+    """
+    _stream_to_file for the asyncio backend.  Writes run in a worker thread,
+    overlapped with reading the next chunk, so a slow disk never stalls the
+    event loop and the other transfers on it.
+    """
+    file = await asyncio.to_thread(open, temp_path, "ab" if offset else "wb")
+    bar = tqdm(total=total, initial=offset, unit="iB", unit_scale=True, desc=desc) if total else None
+    pending = None
+    try:
+        async for chunk in response.aiter_bytes(chunk_size):
+            if pending:
+                await pending
+            pending = asyncio.ensure_future(asyncio.to_thread(file.write, chunk))
+            if bar:
+                bar.update(len(chunk))
+        if pending:
+            await pending
+    finally:
+        if pending and not pending.done():
+            await asyncio.wait([pending])
+        if bar:
+            bar.close()
+        await asyncio.to_thread(file.close)
+
+
+def download_all(jobs, workers, limiter, manifest=None):
+    """Run (url, filepath) jobs on a thread pool; returns a Counter of outcomes."""
+    show_progress = workers == 1
+
+    def _download(url, filepath):
+        print(f"⬇ Downloading: {os.path.basename(filepath)}")
+        return download_file(thread_session(), url, filepath, limiter, show_progress, manifest)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_download, url, filepath) for url, filepath in jobs]
+        return Counter(future.result() for future in as_completed(futures))
+
+
+async def download_all_async(jobs, workers, limiter, http2=False, manifest=None):
+    """
+    Run (url, filepath) jobs on one event loop; returns a Counter of outcomes.
+    All jobs share one keep-alive connection pool, and with `http2` the
+    requests to one host are multiplexed over a single connection.
+    """
+    import httpx
+
+    show_progress = workers == 1
+    in_flight = asyncio.Semaphore(workers)
+    limits = httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+
+    async with httpx.AsyncClient(http2=http2, limits=limits, timeout=30,
+                                 follow_redirects=True) as client:
+        async def _download(url, filepath):
+            async with in_flight:
+                print(f"⬇ Downloading: {os.path.basename(filepath)}")
+                return await download_file_async(client, url, filepath, limiter, show_progress,
+                                                 manifest)
+
+        results = await asyncio.gather(*(_download(url, filepath) for url, filepath in jobs))
+    return Counter(results)
+
+
+def run_backend(backend, jobs, workers, per_host, delay, http2=False, manifest=None):
+    """Download `jobs` with the "threads" or "async" backend; returns a Counter of outcomes."""
+    if backend == "async":
+        return asyncio.run(download_all_async(jobs, workers, AsyncHostLimiter(per_host, delay),
+                                              http2, manifest))
+    return download_all(jobs, workers, HostLimiter(per_host, delay), manifest)
+
+
+class LatencyHandler(SimpleHTTPRequestHandler):
+    """Static files over keep-alive HTTP/1.1, each response `latency` seconds late."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(directory, latency=0.0, handler_class=LatencyHandler):
+    """
+    Serve `directory` from a local HTTP server on a free port for the
+    duration of the block; yields the base URL.  `latency` stands in for the
+    round trip to a real host.  Used by the benchmark and the tests.
+    """
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024           # the async client connects all at once
+        daemon_threads = True
+
+    handler = type(handler_class.__name__, (handler_class,), {"latency": latency})
+    server = Server(("127.0.0.1", 0), partial(handler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def benchmark_backends(n_files=200, size=1024 * 1024, workers=MAX_WORKERS, latency=0.05):
+    """
+    Time both backends fetching `n_files` files of `size` bytes from a local
+    HTTP server that adds `latency` seconds to each response (a stand-in for
+    the round trip to a real host).  The server speaks HTTP/1.1 only, so this
+    measures pooling, chunking and writes, not HTTP/2 multiplexing.
+    """
+    root = tempfile.mkdtemp(prefix="paper_bench_")
+    served = os.path.join(root, "served")
+    os.makedirs(served)
+    body = b"%PDF-1.4\n" + os.urandom(size - 16) + b"\n%%EOF\n"
+    for i in range(n_files):
+        with open(os.path.join(served, f"{i:04d}.pdf"), "wb") as f:
+            f.write(body)
+
+    try:
+        with serve_directory(served, latency) as base_url:
+            print(f"Serving {n_files} × {size // 1024} KiB at {base_url} "
+                  f"(+{latency * 1000:.0f} ms per response), {workers} worker(s)\n")
+            for backend in ("threads", "async"):
+                out = os.path.join(root, backend)
+                os.makedirs(out)
+                jobs = [(f"{base_url}/{i:04d}.pdf", os.path.join(out, f"{i:04d}.pdf"))
+                        for i in range(n_files)]
+                t0 = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    downloaded = run_backend(backend, jobs, workers, workers, 0)["downloaded"]
+                elapsed = time.perf_counter() - t0
+                intact = sum(os.path.getsize(path) == size for _, path in jobs if os.path.exists(path))
+                print(f"  {backend:<8s} {downloaded}/{n_files} downloaded ({intact} intact)  "
+                      f"{elapsed:6.2f}s  {n_files * size / elapsed / 2**20:7.1f} MiB/s")
+                shutil.rmtree(out, ignore_errors=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# ===============================
+# CATALOG
+# ===============================
+
+_ARXIV_ID = r"(\d{4}\.\d{4,5}(?:v\d+)?|[a-z][a-z\-]*(?:\.[A-Z]{2})?/\d{7}(?:v\d+)?)"
+ARXIV_ID_RE = re.compile(rf"^(?:arxiv:)?{_ARXIV_ID}$", re.IGNORECASE)
+ARXIV_URL_RE = re.compile(rf"^https?://(?:www\.|export\.)?arxiv\.org/(?:abs|pdf)/{_ARXIV_ID}(?:\.pdf)?/?$",
+                          re.IGNORECASE)
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+ARXIV_API_BATCH = 100        # IDs per metadata request
+ARXIV_API_DELAY = 3          # seconds between metadata requests (arXiv API guidelines)
+_VERSION_RE = re.compile(r"v\d+$")
+_NUMBER_PREFIX_RE = re.compile(r"^\d+\s+")
+
+
+def arxiv_id(ref):
+    """The arXiv ID in a bare ID ("1706.03762", "arXiv:hep-th/9901001") or an arXiv abs/pdf URL."""
+    ref = ref.strip()
+    match = ARXIV_ID_RE.match(ref) or ARXIV_URL_RE.match(ref)
+    return match.group(1) if match else None
+
+
+def resolve_ref(ref):
+    """
+    (download URL, dedupe key) for a catalog reference.  arXiv IDs and abs
+    pages resolve to the PDF, and every spelling of one paper shares a key.
+    """
+    paper_id = arxiv_id(ref)
+    if paper_id:
+        return f"https://arxiv.org/pdf/{paper_id}.pdf", f"arxiv:{paper_id.lower()}"
+    return ref.strip(), ref.strip()
+
+
+def _catalog_entry(item, category):
+    """
+    (title, ref) from a [title, ref] pair, a bare ref, or a {"title", "url"/"arxiv"}
+    mapping.  A ref that isn't a string is an error rather than str()-ed: an
+    unquoted arXiv ID has already been parsed as a number by YAML/JSON, and
+    2104.09860 -> "2104.0986" is a valid ID for a different paper.
+    """
+    if isinstance(item, dict):
+        title, ref = item.get("title"), item.get("url") or item.get("arxiv") or item.get("id")
+    elif isinstance(item, (list, tuple)) and len(item) == 2:
+        title, ref = item
+    else:
+        title, ref = None, item
+    if ref is not None and not isinstance(ref, str):
+        hint = " (quote arXiv IDs, e.g. \"2104.09860\")" if isinstance(ref, (int, float)) else ""
+        raise ValueError(f"{category}: entry {item!r} has a URL/arXiv ID that is not a string{hint}")
+    return str(title or ""), ref or ""
+
+
+def load_catalog(path):
+    """
+    Read a paper catalog into the shape of `papers`: {category: [(title, ref), …]}
+    where `ref` is a URL or a bare arXiv ID and the title may be empty.
+
+    YAML (needs PyYAML) and JSON hold either such a mapping — entries as
+    [title, ref] pairs, bare refs or {"title", "url"/"arxiv"} objects — or a
+    list of those objects with a "category" key.  CSV needs a header row
+    with category, title and url (or arxiv) columns.  In YAML and JSON, arXiv
+    IDs must be quoted strings: unquoted they are read as numbers.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="" if ext == ".csv" else None) as f:
+        if ext == ".csv":
+            data = list(csv.DictReader(f))
+        elif ext in (".yaml", ".yml"):
+            import yaml
+            data = yaml.safe_load(f)
+        elif ext == ".json":
+            data = json.load(f)
+        else:
+            raise ValueError(f"unsupported catalog format {ext!r} (use .yaml, .json or .csv)")
+
+    catalog = {}
+    if isinstance(data, dict):
+        for category, items in data.items():
+            catalog[str(category)] = [_catalog_entry(item, category) for item in items or ()]
+    else:
+        for record in data or ():
+            category = str(record.get("category") or "Uncategorized")
+            catalog.setdefault(category, []).append(_catalog_entry(record, category))
+    return catalog
+
+
+def fetch_arxiv_titles(ids):
+    """
+    Titles for arXiv IDs from the export API, ARXIV_API_BATCH IDs per request.
+    Keyed by ID without version; IDs the API cannot resolve are left out.
+    """
+    import xml.etree.ElementTree as ET
+    atom = {"a": "http://www.w3.org/2005/Atom"}
+
+    ids = list(dict.fromkeys(ids))
+    titles = {}
+    for start in range(0, len(ids), ARXIV_API_BATCH):
+        if start:
+            time.sleep(ARXIV_API_DELAY)
+        batch = ids[start:start + ARXIV_API_BATCH]
+        try:
+            response = requests.get(ARXIV_API_URL, timeout=30, params={
+                "id_list": ",".join(batch), "max_results": len(batch)})
+            response.raise_for_status()
+            feed = ET.fromstring(response.content)
+        except (requests.RequestException, ET.ParseError) as e:
+            print(f"⚠ arXiv title lookup failed for {len(batch)} ID(s): {e}")
+            continue
+        for entry in feed.findall("a:entry", atom):
+            entry_url = entry.findtext("a:id", "", atom)
+            if "/abs/" not in entry_url:        # error entries for unknown IDs
+                continue
+            base_id = _VERSION_RE.sub("", entry_url.split("/abs/", 1)[1])
+            titles[base_id] = " ".join(entry.findtext("a:title", "", atom).split())
+    return titles
+
+
+def plan_targets(catalog, base_dir):
+    """
+    Resolve the whole catalog before any download starts: URLs and dedupe
+    keys, titles (one batched arXiv lookup for entries without one),
+    sanitized filenames and category folders, each created once.
+    Returns {category: [(filename, filepath, url, key), …]}.
+    """
+    resolved = {}
+    for category, entries in catalog.items():
+        resolved[category] = [(title, *(resolve_ref(ref) if ref.strip() else ("", "")))
+                              for title, ref in entries]
+
+    untitled = [key[len("arxiv:"):] for entries in resolved.values()
+                for title, _, key in entries if not title.strip() and key.startswith("arxiv:")]
+    titles = {}
+    if untitled:
+        print(f"🔎 Looking up {len(set(untitled))} arXiv title(s)...")
+        titles = fetch_arxiv_titles(untitled)
+
+    targets = {}
+    for category, entries in resolved.items():
+        category_path = os.path.join(base_dir, sanitize_filename(category))
+        os.makedirs(category_path, exist_ok=True)
+        targets[category] = planned = []
+        for idx, (title, url, key) in enumerate(entries, start=1):
+            # Strip the manual number prefix ("01 Title") the built-in list uses
+            clean_title = _NUMBER_PREFIX_RE.sub("", title.strip())
+            if not clean_title and key.startswith("arxiv:"):
+                paper_id = key[len("arxiv:"):]
+                clean_title = titles.get(_VERSION_RE.sub("", paper_id), paper_id)
+            elif not clean_title:
+                clean_title = os.path.splitext(os.path.basename(urlsplit(url).path))[0] or "untitled"
+
+            # Loop numbering for the filename
+            filename = f"{idx:02d}. {sanitize_filename(clean_title)}.pdf"
+            planned.append((filename, os.path.join(category_path, filename), url, key))
+    return targets
+
+
+def _same_file(path, source):
+    """True if `path` is `source` (hardlink) or an unchanged copy of it."""
+    try:
+        if os.path.samefile(path, source):
+            return True
+        a, b = os.stat(path), os.stat(source)
+    except OSError:
+        return False
+    return (a.st_size, a.st_mtime_ns) == (b.st_size, b.st_mtime_ns)
+
+
+def link_duplicates(links, manifest=None):
+    """
+    Give each duplicate (filepath, source) target the bytes of the copy that
+    was downloaded: a hardlink, or a copy across filesystems.  Targets that
+    already match are left alone; returns (linked, missing source).
+    """
+    linked = missing = 0
+    for filepath, source in links:
+        if not os.path.exists(source):
+            missing += 1
+            continue
+        if os.path.exists(filepath) and _same_file(filepath, source):
+            continue
+        tmp_path = filepath + ".link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, filepath)
+        if manifest:
+            manifest.alias(filepath, source)
+        print(f"🔗 Linked duplicate: {os.path.basename(filepath)}")
+        linked += 1
+    return linked, missing
 
 
 # ===============================
 # MAIN
 # ===============================
 
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download a list of papers into category folders.")
+    parser.add_argument(
+        "--catalog",
+        metavar="PATH",
+        help="Paper list to download instead of the built-in one: .yaml, .json or .csv "
+             "(see load_catalog); entries may be URLs or bare arXiv IDs",
+    )
+    parser.add_argument(
+        "--dest",
+        default=BASE_DIR,
+        help="Target directory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="Downloads in flight overall (default: %(default)s, 1 = one at a time)",
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=MAX_PER_HOST,
+        help="Downloads in flight per host (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=DELAY_BETWEEN_DOWNLOADS,
+        help="Minimum seconds between request starts to the same host (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("threads", "async"),
+        default="threads",
+        help="threads: requests on a thread pool; async: one asyncio loop over a shared "
+             "httpx connection pool (needs: pip install httpx) (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="With --backend async, multiplex requests to each host over one HTTP/2 "
+             "connection (needs: pip install 'httpx[http2]')",
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        nargs="?",
+        const=200,
+        metavar="N_FILES",
+        help="Time both backends against a local server serving N_FILES files "
+             "(default 200), then exit",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-hash every existing file against the manifest (default: only files "
+             "whose size or mtime changed)",
+    )
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="Ask the server whether each existing paper changed (If-None-Match / "
+             "If-Modified-Since) and re-fetch only those that did",
+    )
+    return parser
+
+
 def main():
-    os.makedirs(BASE_DIR, exist_ok=True)
+    args = build_parser().parse_args()
+    workers = max(1, args.workers)
+
+    if args.benchmark:
+        if importlib.util.find_spec("httpx") is None:
+            print("httpx not installed — cannot benchmark the async backend. Run: pip install httpx")
+        else:
+            benchmark_backends(args.benchmark, workers=workers)
+        return
+
+    if args.backend == "async" and importlib.util.find_spec("httpx") is None:
+        print("httpx not installed — using the threads backend. Run: pip install httpx")
+        args.backend = "threads"
+    if args.backend == "async" and args.http2 and importlib.util.find_spec("h2") is None:
+        print("h2 not installed — using HTTP/1.1. Run: pip install 'httpx[http2]'")
+        args.http2 = False
+
+    catalog = papers
+    if args.catalog:
+        try:
+            catalog = load_catalog(args.catalog)
+        except ImportError:
+            print("PyYAML not installed — cannot read a YAML catalog. Run: pip install pyyaml")
+            return
+        except Exception as e:              # unreadable file, bad syntax or shape
+            print(f"❌ Cannot read catalog {args.catalog}: {e}")
+            return
+
+    base_dir = os.path.expanduser(args.dest)
+    os.makedirs(base_dir, exist_ok=True)
 
     total_downloaded = 0
     total_failed = 0
     total_skipped = 0
     total_unavailable = 0
+    total_unchanged = 0
+    total_bad = 0
+    total_linked = 0
 
-    session = requests.Session()
+    manifest = Manifest(base_dir)
 
     print("🚀 Starting paper download process...")
-    print(f"📁 Target directory: {BASE_DIR}\n")
-
-    for category, paper_list in papers.items():
-        category_path = os.path.join(BASE_DIR, sanitize_filename(category))
-        os.makedirs(category_path, exist_ok=True)
+    print(f"📁 Target directory: {base_dir}\n")
 
+    # Work out every target path first; only the missing files become jobs,
+    # and a paper listed under several categories is fetched once
+    targets = plan_targets(catalog, base_dir)
+    jobs = []
+    links = []          # (filepath, filepath of the copy that is downloaded)
+    first_target = {}   # dedupe key -> filepath
+    for category, planned in targets.items():
         print(f"\n{'='*60}")
         print(f"📂 Category: {category}")
         print(f"{'='*60}")
 
-        for idx, (title, url) in enumerate(paper_list, start=1):
-            # Strip first 3 characters (manual number + space)
-            clean_title = title[3:].strip()
-            safe_title = sanitize_filename(clean_title)
-
-            # Loop numbering for the filename
-            filename = f"{idx:02d}. {safe_title}.pdf"
-            filepath = os.path.join(category_path, filename)
-
+        for filename, filepath, url, key in planned:
             # Skip if no valid URL provided
-            if not url or url.strip() == "":
+            if not url:
                 print(f"⊘ No URL available: {filename}")
                 total_unavailable += 1
                 continue
 
-            if os.path.exists(filepath):
-                print(f"✔ Already exists: {filename}")
-                total_skipped += 1
+            if key in first_target:
+                links.append((filepath, first_target[key]))
                 continue
+            first_target[key] = filepath
 
-            print(f"⬇ Downloading: {filename}")
+            if os.path.exists(filepath):
+                problem = manifest.verify(filepath, url, full=args.verify)
+                if problem:
+                    # Replaced once the new copy is complete; no entry = no conditional request
+                    print(f"✖ Re-fetching {filename}: {problem}")
+                    manifest.drop(filepath)
+                    total_bad += 1
+                elif not args.revalidate:
+                    print(f"✔ Already exists: {filename}")
+                    total_skipped += 1
+                    continue
 
-            success = download_file(session, url, filepath)
+            jobs.append((url, filepath))
 
-            if success:
-                total_downloaded += 1
-            else:
-                total_failed += 1
+    if jobs:
+        print(f"\n⬇ {len(jobs)} file(s) to download ({args.backend} backend, "
+              f"{workers} worker(s), {args.per_host} per host)\n")
+        try:
+            outcomes = run_backend(args.backend, jobs, workers, args.per_host,
+                                   args.delay, args.http2, manifest)
+        except BaseException:
+            manifest.save()
+            raise
+        total_downloaded = outcomes["downloaded"]
+        total_unchanged = outcomes["unchanged"]
+        total_failed = outcomes["failed"]
 
-            time.sleep(DELAY_BETWEEN_DOWNLOADS)
+    if links:
+        total_linked, unlinked = link_duplicates(links, manifest)
+        total_failed += unlinked
+    manifest.save()
 
     print("\n" + "="*60)
     print("📊 DOWNLOAD SUMMARY")
     print("="*60)
     print(f"✅ Downloaded        : {total_downloaded}")
     print(f"⏭️ Skipped (exists)  : {total_skipped}")
+    if args.revalidate:
+        print(f"🔁 Unchanged (304)   : {total_unchanged}")
+    print(f"✖ Bad, re-fetched    : {total_bad}")
+    print(f"🔗 Linked duplicates : {total_linked}")
     print(f"⊘ Not available      : {total_unavailable}")
     print(f"❌ Failed            : {total_failed}")
-    print(f"📄 Total attempted   : {total_downloaded + total_failed}")
+    print(f"📄 Total attempted   : {total_downloaded + total_unchanged + total_failed}")
     print("="*60 + "\n")
 
     if total_unavailable > 0:
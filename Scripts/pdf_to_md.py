@@ -7,14 +7,25 @@ Install:
     pip install marker-pdf
     # For citation extraction:
     pip install ollama  (requires Ollama running locally)
+    # For --batch-pages / --batch-mem:
+    pip install pymupdf
 """
 
 import os
+import re
 import json
+import time
+import uuid
+import tempfile
 import argparse
 import logging
+import threading
+import multiprocessing
+from functools import lru_cache
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import conversion_cache
 
 # ── Logging ───────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -28,9 +39,42 @@ log = logging.getLogger(__name__)
 CONVERTED_DIR   = "Converted"
 CITATIONS_FILE  = "citations.json"
 DEFAULT_WORKERS = 2          # keep low — marker-pdf is CPU/GPU heavy
+WORKER_MEM_GB   = 4.0        # rough RAM per process-pool worker (models + one PDF)
+BATCH_PAGES_PER_GB = 20      # rough pages marker holds in flight per GB (CPU)
+
+# Passed to marker's convert_single_pdf; also part of the conversion cache key
+MARKER_OPTIONS = {
+    "langs": ["English"],    # add more ISO-639-1 codes if needed
+    "batch_multiplier": 2,   # higher = faster on GPU, lower on CPU
+}
 OLLAMA_MODEL    = "llama3"   # change to any model you have pulled
 
 
+# ── Model registry ────────────────────────────────────────────────────────────
+
+_models      = None              # marker models, shared by every thread in the process
+_models_lock = threading.Lock()
+
+
+def get_models():
+    """
+    Return the marker models, loading them on first use.  The load takes
+    several seconds and a lot of memory, so it happens at most once per
+    process: concurrent callers block on the lock until the first one is
+    done and then share the same object.
+    """
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                from marker.models import load_all_models
+                t0 = time.perf_counter()
+                _models = load_all_models()
+                log.info("Marker models loaded in %.1fs (pid %d)",
+                         time.perf_counter() - t0, os.getpid())
+    return _models
+
+
 # ── Conversion ────────────────────────────────────────────────────────────────
 
 def convert_pdf(pdf_path: Path) -> str:
@@ -48,18 +92,108 @@ def convert_pdf(pdf_path: Path) -> str:
     """
     # Import here so the rest of the script stays importable without marker installed
     from marker.convert import convert_single_pdf
-    from marker.models import load_all_models
 
-    models = load_all_models()   # cached after first call in the same process
     full_text, _metadata, _images = convert_single_pdf(
         str(pdf_path),
-        models,
-        langs=["English"],        # add more ISO-639-1 codes if needed
-        batch_multiplier=2,       # higher = faster on GPU, lower on CPU
+        get_models(),
+        **MARKER_OPTIONS,
     )
     return full_text
 
 
+# ── Conversion cache ──────────────────────────────────────────────────────────
+
+def cache_key(pdf_path: Path, merged: bool = False) -> str:
+    """
+    Content-addressed cache key for one PDF (see conversion_cache.py).
+    Markdown cut out of a merged batch (`merged`) gets its own key: marker
+    saw the neighbouring documents' pages, so it needn't match a standalone
+    conversion.
+    """
+    st = pdf_path.stat()
+    return _cache_key(str(pdf_path), st.st_size, st.st_mtime_ns, merged)
+
+
+@lru_cache(maxsize=4096)
+def _cache_key(path: str, _size: int, _mtime_ns: int, merged: bool) -> str:
+    # size / mtime only make the memo notice a replaced file
+    options = {**MARKER_OPTIONS, "postprocess": "clean_markdown"}
+    if merged:
+        options["batch"] = "merged"
+    return conversion_cache.cache_key(
+        Path(path), "marker-pdf", conversion_cache.package_version("marker-pdf"), options,
+    )
+
+
+def lookup_keys(pdf_path: Path, batched: bool = False) -> list[str]:
+    """Keys a conversion may be served from: standalone, then (in batch mode) merged."""
+    return [cache_key(pdf_path)] + ([cache_key(pdf_path, merged=True)] if batched else [])
+
+
+def is_cached(pdf_path: Path, cache_dir: Path | None, batched: bool = False) -> bool:
+    if cache_dir is None:
+        return False
+    try:
+        return any(conversion_cache.has(key, cache_dir) for key in lookup_keys(pdf_path, batched))
+    except OSError:
+        return False
+
+
+# ── Process-pool workers ──────────────────────────────────────────────────────
+
+def _init_worker(torch_threads: int) -> None:
+    """
+    Process-pool initializer: pin the worker's math libraries to its share of
+    the cores, then load the marker models up front for every PDF it converts.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(torch_threads)
+
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    log.info("Worker %d: %d thread(s)", os.getpid(), torch_threads)
+    get_models()
+
+
+def _available_memory() -> int | None:
+    """Bytes of RAM currently available, or None if it can't be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def resolve_workers(requested: int, worker_mem_gb: float = WORKER_MEM_GB) -> int:
+    """
+    Worker count for the process pool.  0 means auto: one worker per core,
+    capped by how many `worker_mem_gb` model copies fit in available memory.
+    An explicit count is kept, with a warning if it will not fit.
+    """
+    cores = os.cpu_count() or 1
+    avail = _available_memory()
+    fit   = max(1, int(avail / (worker_mem_gb * 1024 ** 3))) if avail else None
+
+    if requested > 0:
+        if fit is not None and requested > fit:
+            log.warning("%d workers × %.1f GB exceeds the %.1f GB of free memory — "
+                        "expect swapping (try --workers 0)", requested, worker_mem_gb,
+                        avail / 1024 ** 3)
+        return requested
+
+    workers = min(cores, fit) if fit is not None else cores
+    log.info("Auto workers: %d (%d core(s), %s free memory at %.1f GB each)", workers, cores,
+             f"{avail / 1024 ** 3:.1f} GB" if avail else "unknown", worker_mem_gb)
+    return workers
+
+
 # ── Citation extraction ───────────────────────────────────────────────────────
 
 CITATION_SYSTEM_PROMPT = """\
@@ -171,10 +305,16 @@ def process_pdf(
     output_dir: Path,
     extract_citations: bool,
     ollama_model: str,
+    cache_dir: Path | None = None,
+    cache_link: bool = True,
+    batched: bool = False,
 ) -> dict:
     """
-    Convert one PDF and optionally extract its citations.
-    Returns a result dict suitable for a summary report.
+    Convert one PDF and optionally extract its citations.  With a `cache_dir`
+    the markdown comes from the conversion cache when this content was
+    converted before with the same settings, and is added to it otherwise.
+    `batched` (from `process_batch`) also accepts a cached merged-batch
+    conversion.  Returns a result dict suitable for a summary report.
     """
     base    = pdf_path.stem
     md_path = output_dir / (base + ".md")
@@ -184,41 +324,185 @@ def process_pdf(
         return {"file": str(pdf_path), "status": "skipped"}
 
     try:
+        keys = lookup_keys(pdf_path, batched) if cache_dir is not None else []
+        if any(conversion_cache.materialize(key, md_path, cache_dir, cache_link) for key in keys):
+            log.info("♻️  From cache: %s", md_path)
+            return finish_pdf(pdf_path, md_path, None, extract_citations, ollama_model)
+
         log.info("Converting: %s", pdf_path)
-        raw_md   = convert_pdf(pdf_path)
-        clean_md = clean_markdown(raw_md)
+        result = finish_pdf(pdf_path, md_path, convert_pdf(pdf_path),
+                            extract_citations, ollama_model)
+        if keys:
+            conversion_cache.store(keys[0], md_path, cache_dir)
+        return result
+    except Exception as exc:
+        log.error("❌  %s | %s", pdf_path, exc)
+        return {"file": str(pdf_path), "status": "error", "error": str(exc)}
+
 
+def finish_pdf(
+    pdf_path: Path,
+    md_path: Path,
+    raw_md: str | None,
+    extract_citations: bool,
+    ollama_model: str,
+) -> dict:
+    """
+    Clean and write the markdown for one converted PDF, then optionally
+    extract its citations.  `raw_md` = None means `md_path` is already in
+    place (a cache hit).  Returns the result dict for the summary report.
+    """
+    output_dir = md_path.parent
+    base       = pdf_path.stem
+    if raw_md is None:
+        clean_md = md_path.read_text(encoding="utf-8")
+    else:
+        clean_md = clean_markdown(raw_md)
         md_path.write_text(clean_md, encoding="utf-8")
         log.info("✅  Written: %s", md_path)
 
-        citations = []
-        if extract_citations:
-            refs = extract_references_section(clean_md)
-            if refs:
-                log.info("   Extracting citations via Ollama (%s)…", ollama_model)
-                citations = extract_citations_with_ollama(refs, ollama_model)
-                if citations:
-                    cit_path = output_dir / (base + "_citations.json")
-                    cit_path.write_text(
-                        json.dumps(citations, indent=2, ensure_ascii=False),
-                        encoding="utf-8",
-                    )
-                    log.info("   📚  %d citations saved → %s", len(citations), cit_path.name)
-                else:
-                    log.info("   (no citations extracted)")
+    citations = []
+    if extract_citations:
+        refs = extract_references_section(clean_md)
+        if refs:
+            log.info("   Extracting citations via Ollama (%s)…", ollama_model)
+            citations = extract_citations_with_ollama(refs, ollama_model)
+            if citations:
+                cit_path = output_dir / (base + "_citations.json")
+                cit_path.write_text(
+                    json.dumps(citations, indent=2, ensure_ascii=False),
+                    encoding="utf-8",
+                )
+                log.info("   📚  %d citations saved → %s", len(citations), cit_path.name)
             else:
-                log.info("   (no references section found)")
+                log.info("   (no citations extracted)")
+        else:
+            log.info("   (no references section found)")
+
+    return {
+        "file":      str(pdf_path),
+        "status":    "ok",
+        "md":        str(md_path),
+        "citations": len(citations),
+        "cached":    raw_md is None,
+    }
 
-        return {
-            "file":      str(pdf_path),
-            "status":    "ok",
-            "md":        str(md_path),
-            "citations": len(citations),
-        }
 
+# ── Batched conversion ────────────────────────────────────────────────────────
+#
+# marker batches its models over the pages of one document, so a 4-page paper
+# never fills a batch.  Short PDFs are merged into one document of up to
+# `max_pages` pages, with a separator page carrying a unique token between
+# them, converted in one call and the markdown cut back apart at the tokens.
+
+_BATCH_SEPARATOR = "PDFTOMDDOCUMENTBREAK"
+
+
+def plan_batches(tasks: list[tuple], max_pages: int) -> list[list[tuple]]:
+    """
+    Group (pdf, output_dir) tasks into batches of at most `max_pages` pages,
+    in order.  PDFs that are already converted, unreadable or at least
+    `max_pages` long stay on their own.  Raises ImportError without pymupdf.
+    """
+    import pymupdf
+
+    def _pages(pdf: Path) -> int:
+        with pymupdf.open(pdf) as doc:
+            return doc.page_count
+
+    batches: list[list[tuple]] = []
+    current: list[tuple] = []
+    pages = 0
+    for pdf, out in tasks:
+        try:
+            n = _pages(pdf) if not (out / (pdf.stem + ".md")).exists() else max_pages
+        except Exception:
+            n = max_pages
+        if n >= max_pages:
+            batches.append([(pdf, out)])
+            continue
+        if current and pages + n + 1 > max_pages:
+            batches.append(current)
+            current, pages = [], 0
+        current.append((pdf, out))
+        pages += n + 1                            # + separator page
+    if current:
+        batches.append(current)
+    return batches
+
+
+def merge_pdfs(pdf_paths: list[Path], merged_path: Path, token: str) -> None:
+    """Concatenate the PDFs, with a separator page before each one after the first."""
+    import pymupdf
+    with pymupdf.open() as merged:
+        for i, pdf in enumerate(pdf_paths):
+            if i:
+                page = merged.new_page()
+                page.insert_text((72, 72), f"{_BATCH_SEPARATOR}{token}N{i}", fontsize=12)
+            with pymupdf.open(pdf) as doc:
+                merged.insert_pdf(doc)
+        merged.save(merged_path)
+
+
+def split_markdown(markdown: str, token: str, n_docs: int) -> list[str] | None:
+    """
+    Cut the merged markdown at the separator lines.  Returns None unless all
+    `n_docs - 1` separators come back, in order.
+    """
+    sep = re.compile(rf"^.*{_BATCH_SEPARATOR}{token}N(\d+).*$\n?", re.MULTILINE)
+    marks = list(sep.finditer(markdown))
+    if [int(m.group(1)) for m in marks] != list(range(1, n_docs)):
+        return None
+    bounds = [0] + [pos for m in marks for pos in (m.start(), m.end())] + [len(markdown)]
+    return [markdown[bounds[i]:bounds[i + 1]] for i in range(0, len(bounds), 2)]
+
+
+def process_batch(
+    batch: list[tuple],
+    extract_citations: bool,
+    ollama_model: str,
+    cache_dir: Path | None = None,
+    cache_link: bool = True,
+) -> list[dict]:
+    """
+    Convert a batch from `plan_batches` in one marker call.  Falls back to
+    one call per PDF if the merge fails or the separators don't survive.
+    PDFs converted in the meantime or found in the cache are taken out first.
+    Merged conversions are cached under their own key (see `cache_key`), so
+    a later standalone run converts those PDFs properly.
+    """
+    single = lambda pdf, out: process_pdf(pdf, out, extract_citations, ollama_model,
+                                          cache_dir, cache_link, batched=True)
+    done  = [(pdf, out) for pdf, out in batch
+             if (out / (pdf.stem + ".md")).exists() or is_cached(pdf, cache_dir, batched=True)]
+    batch = [task for task in batch if task not in done]
+    results = [single(pdf, out) for pdf, out in done]
+    if len(batch) <= 1:
+        return results + [single(pdf, out) for pdf, out in batch]
+
+    token = uuid.uuid4().hex[:12].upper()
+    try:
+        with tempfile.TemporaryDirectory(prefix="pdf_to_md_") as tmp:
+            merged = Path(tmp) / "batch.pdf"
+            merge_pdfs([pdf for pdf, _ in batch], merged, token)
+            log.info("Converting batch of %d PDFs: %s …", len(batch), batch[0][0].name)
+            parts = split_markdown(convert_pdf(merged), token, len(batch))
     except Exception as exc:
-        log.error("❌  %s | %s", pdf_path, exc)
-        return {"file": str(pdf_path), "status": "error", "error": str(exc)}
+        log.warning("Batch of %d failed (%s) — converting one by one", len(batch), exc)
+        parts = None
+    if parts is None:
+        return results + [single(pdf, out) for pdf, out in batch]
+
+    for (pdf, out), raw_md in zip(batch, parts):
+        md_path = out / (pdf.stem + ".md")
+        try:
+            results.append(finish_pdf(pdf, md_path, raw_md, extract_citations, ollama_model))
+            if cache_dir is not None:
+                conversion_cache.store(cache_key(pdf, merged=True), md_path, cache_dir)
+        except Exception as exc:
+            log.error("❌  %s | %s", pdf, exc)
+            results.append({"file": str(pdf), "status": "error", "error": str(exc)})
+    return results
 
 
 # ── Directory walker ──────────────────────────────────────────────────────────
@@ -228,11 +512,30 @@ def walk_and_convert(
     extract_citations: bool,
     ollama_model: str,
     workers: int,
+    processes: bool = False,
+    worker_mem_gb: float = WORKER_MEM_GB,
+    batch_pages: int = 0,
+    cache_dir: Path | None = None,
+    cache_link: bool = True,
+    cache_max_gb: float = 0,
 ) -> None:
     """
     Recursively convert all PDFs under `root`, mirroring the folder structure
     into a sibling `Converted/` subdirectory at each level.
 
+    With `processes` the PDFs go to a process pool instead of threads, so
+    conversions run on separate cores rather than contending for the GIL.
+    Each worker loads the models once at start-up and splits the cores evenly
+    with the others; `workers` = 0 sizes the pool from cores and free memory.
+
+    With `batch_pages` > 0 short PDFs are converted together in batches of up
+    to that many pages (see `plan_batches`).
+
+    With a `cache_dir` every conversion goes through the shared conversion
+    cache, so moved, renamed or duplicate PDFs are not converted again;
+    `cache_max_gb` > 0 trims it to that size afterwards (least recently used
+    first).
+
     Skipping logic:
       • Any directory named "Converted" is skipped entirely (no double-processing).
       • Already-converted files (md exists) are skipped without re-reading the PDF.
@@ -257,22 +560,59 @@ def walk_and_convert(
         log.info("No PDFs found under %s", root)
         return
 
-    log.info("Found %d PDF(s) to process (workers=%d)", len(tasks), workers)
+    if processes:
+        workers = resolve_workers(workers, worker_mem_gb)
+        # spawn, not fork: torch / CUDA state must not be inherited
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(max(1, (os.cpu_count() or 1) // workers),),
+        )
+    else:
+        workers = workers or DEFAULT_WORKERS
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    log.info("Found %d PDF(s) to process (%s=%d)", len(tasks),
+             "processes" if processes else "workers", workers)
     results = []
 
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = {
-            pool.submit(process_pdf, pdf, out, extract_citations, ollama_model): pdf
-            for pdf, out in tasks
-        }
-        for fut in as_completed(futures):
-            results.append(fut.result())
+    if batch_pages > 0:
+        try:
+            batches = plan_batches(tasks, batch_pages)
+            log.info("Grouped into %d batch(es) of up to %d pages", len(batches), batch_pages)
+        except ImportError:
+            log.warning("pymupdf not installed — batching disabled. Run: pip install pymupdf")
+            batch_pages = 0
+
+    with pool:
+        if batch_pages > 0:
+            futures = [pool.submit(process_batch, batch, extract_citations, ollama_model,
+                                   cache_dir, cache_link)
+                       for batch in batches]
+            for fut in as_completed(futures):
+                results.extend(fut.result())
+        else:
+            futures = {
+                pool.submit(process_pdf, pdf, out, extract_citations, ollama_model,
+                            cache_dir, cache_link): pdf
+                for pdf, out in tasks
+            }
+            for fut in as_completed(futures):
+                results.append(fut.result())
 
     # Summary
     ok      = sum(1 for r in results if r["status"] == "ok")
     skipped = sum(1 for r in results if r["status"] == "skipped")
     errors  = sum(1 for r in results if r["status"] == "error")
-    log.info("Done — %d converted, %d skipped, %d errors", ok, skipped, errors)
+    cached  = sum(1 for r in results if r.get("cached"))
+    log.info("Done — %d converted (%d from cache), %d skipped, %d errors",
+             ok, cached, skipped, errors)
+
+    if cache_dir is not None and cache_max_gb > 0:
+        removed, freed = conversion_cache.prune(int(cache_max_gb * 1024 ** 3), cache_dir)
+        if removed:
+            log.info("Cache trimmed: %d entries, %.1f MB freed", removed, freed / 1024 ** 2)
 
     if errors:
         for r in results:
@@ -291,6 +631,8 @@ Examples:
   python pdf_to_md.py /data/papers
   python pdf_to_md.py /data/papers --citations
   python pdf_to_md.py /data/papers --citations --model mistral --workers 1
+  python pdf_to_md.py /data/papers --processes --workers 0
+  python pdf_to_md.py /data/papers --batch-pages 64
         """,
     )
     p.add_argument("root", type=Path, help="Root directory containing PDFs")
@@ -305,7 +647,44 @@ Examples:
     p.add_argument(
         "--workers", type=int, default=DEFAULT_WORKERS,
         help=f"Parallel conversion workers (default: {DEFAULT_WORKERS}). "
-             "Keep at 1-2 unless you have a strong GPU.",
+             "Keep at 1-2 unless you have a strong GPU. "
+             "With --processes, 0 picks a count from cores and free memory.",
+    )
+    p.add_argument(
+        "--processes", action="store_true",
+        help="Convert in a process pool (one model copy per worker) instead of threads. "
+             "Use on many-core CPU machines.",
+    )
+    p.add_argument(
+        "--worker-mem", type=float, default=WORKER_MEM_GB, metavar="GB",
+        help=f"RAM to budget per process worker for --workers 0 (default: {WORKER_MEM_GB}).",
+    )
+    p.add_argument(
+        "--batch-pages", type=int, default=0, metavar="N",
+        help="Convert short PDFs together in merged batches of up to N pages "
+             "(needs pymupdf). Best for many short papers on CPU.",
+    )
+    p.add_argument(
+        "--batch-mem", type=float, default=0, metavar="GB",
+        help=f"Size batches from a memory budget instead "
+             f"(about {BATCH_PAGES_PER_GB} pages per GB).",
+    )
+    p.add_argument(
+        "--cache-dir", type=Path, default=conversion_cache.DEFAULT_CACHE_DIR,
+        help="Conversion cache shared with paper_converter.py "
+             f"(default: {conversion_cache.DEFAULT_CACHE_DIR}, or $PDF_MD_CACHE_DIR).",
+    )
+    p.add_argument(
+        "--no-cache", action="store_true",
+        help="Convert everything without reading or filling the conversion cache.",
+    )
+    p.add_argument(
+        "--cache-copy", action="store_true",
+        help="Copy cache hits instead of hardlinking them.",
+    )
+    p.add_argument(
+        "--cache-max-gb", type=float, default=0, metavar="GB",
+        help="Trim the cache to this size after the run, least recently used first.",
     )
     return p
 
@@ -322,6 +701,12 @@ def main() -> None:
         extract_citations=args.citations,
         ollama_model=args.model,
         workers=args.workers,
+        processes=args.processes,
+        worker_mem_gb=args.worker_mem,
+        batch_pages=args.batch_pages or int(args.batch_mem * BATCH_PAGES_PER_GB),
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_link=not args.cache_copy,
+        cache_max_gb=args.cache_max_gb,
     )
 
 
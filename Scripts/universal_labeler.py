@@ -1,14 +1,19 @@
 """
 generate_dataset.py
 ────────────────────────────────────────────────────────────────────────────────
-Drop this script into any folder that contains a nested image dataset.
+Drop this script, together with labeling.py, into any folder that contains a
+nested image dataset.
 
-FIRST RUN  →  scans the folder structure, writes `dataset_config.json`, exits.
+FIRST RUN  →  samples the folder structure, writes `dataset_config.json`, exits.
               Open that file, rename any column header you like, set enabled:false
               to drop a column entirely, then re-run.
 
 SECOND RUN →  reads `dataset_config.json`, builds `dataset.csv` + `dataset.xlsx`.
 
+LATER RUNS →  `dataset_manifest.json` remembers every folder's mtime and listing.
+              Only folders whose mtime changed are re-listed; if nothing changed
+              and the config is the same, the outputs are left as they are.
+
 Internal slot names (the keys in "columns"):
   filename   →  the image file name
   path       →  relative path from the dataset root to the file
@@ -16,235 +21,77 @@ Internal slot names (the keys in "columns"):
   level_2    →  name of the folder at depth 2
   … and so on for however many levels exist
 
+Optional slots (disabled by default):
+  split            →  train / val / test in "split_ratios" proportions within
+                      each "split_stratify" stratum (level slots, also broken
+                      down in the Summary).  Images are ranked by a hash of
+                      their path, so one only changes split when its stratum
+                      grows or shrinks past it; "split_seed" reshuffles.
+
+Enabling one of these runs an extra pass that opens every image in a process
+pool, cached in a JSON file next to the config:
+  content_hash     →  BLAKE2b of the file bytes
+  duplicate_group  →  same id for exact copies and near-duplicates (perceptual
+                      hash within "near_duplicate_distance" bits, 0 = exact
+                      only); also adds a "Duplicates" sheet
+  width, height    →  image size in pixels           ┐ read from the image
+  channels, format →  e.g. 3 / "JPEG"                │ header only, no pixel
+  file_size        →  bytes on disk                  ┘ decoding
+  valid            →  yes / no from an integrity check; "validation" picks
+                      "header" (parse the header, verify the chunk structure,
+                      look for the end-of-image marker — catches empty and
+                      truncated files) or "decode" (also decode every pixel).
+                      Bad files are listed with the reason on a "Corrupt" sheet
+
 You can rename the "header" of any slot to anything you like.
 You can set "enabled": false on any slot to exclude it from the output.
+
+Excel caps a sheet at 1,048,576 rows.  Larger datasets are split across
+Dataset_1, Dataset_2, … sheets ("xlsx_split": "sheets") or across
+dataset_1.xlsx, dataset_2.xlsx, … ("xlsx_split": "files"), each holding at
+most "xlsx_rows_per_sheet" rows.  The Summary sheet always covers everything.
+
+"formats" picks the outputs: any of "csv", "xlsx", "parquet", "arrow".
+Parquet / Arrow IPC (needs pyarrow) store the level columns dictionary-encoded
+and load without any text parsing; the .arrow file can be memory-mapped.
+
+The first run only samples the tree — up to 8 subfolders per folder, 200,000
+entries or 5 seconds, whichever comes first — so it returns almost at once
+even on millions of files.  The depth it reports is then a lower bound; later
+runs warn if they meet deeper images.  --full-scan walks everything instead.
+
+Options:
+  --jobs N        list directories on N threads (helps a lot on NFS / SMB)
+  --full-scan     first run: walk the whole tree instead of sampling it
+  --sample-children / --sample-entries / --sample-seconds
+                  first run: change the sampling budget (0 = no limit)
+  --workers N     processes for the optional per-file stages
+  --rescan        ignore the manifest and re-list every folder
+  --benchmark     time the walker with 1, 4 and 16 jobs, and the fixed-depth
+                  walker, on a synthetic tree
 ────────────────────────────────────────────────────────────────────────────────
 """
 
 import os
-import csv
 import json
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+import argparse
+from labeling import (
+    EXCEL_MAX_ROWS, DEFAULT_SPLIT_RATIOS, DISCOVERY_CHILDREN, DISCOVERY_MAX_ENTRIES,
+    DISCOVERY_SECONDS, EXTRA_SLOTS, METADATA_SLOTS, OUTPUT_FORMATS,
+    scan_tree, discover_structure, load_manifest, save_manifest, config_fingerprint,
+    files_fingerprint, manifest_lister, frozen_lister, run_file_stage, read_image_header,
+    hash_image, find_duplicates, VALIDATION_CHECKS, collect_rows, active_slots, active_headers,
+    int_positions, label_positions, split_assigner, write_outputs, benchmark_scan,
+)
 
 BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "dataset_config.json")
-
-IMAGE_EXTENSIONS = {
-    ".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif",
-    ".webp", ".gif", ".heic", ".heif", ".svg",
-}
-
-# ══════════════════════════════════════════════════════════════════════════════
-#  STRUCTURE DISCOVERY
-# ══════════════════════════════════════════════════════════════════════════════
-
-def _is_image(fname: str) -> bool:
-    return os.path.splitext(fname)[1].lower() in IMAGE_EXTENSIONS
-
-
-def discover_structure(base_dir: str) -> dict:
-    """
-    Walk the tree, find the deepest level that contains images,
-    and return a config skeleton with all slots enabled and named by their slot key.
-    """
-    max_depth = 0
-    sample_tree: dict = {}
-
-    def _walk(current: str, depth: int, node: dict) -> None:
-        nonlocal max_depth
-        entries = sorted(os.listdir(current))
-        images  = [e for e in entries if os.path.isfile(os.path.join(current, e)) and _is_image(e)]
-        subdirs = [e for e in entries if os.path.isdir(os.path.join(current, e)) and not e.startswith(".")]
-
-        if images:
-            node["__images__"] = images[:3]
-            max_depth = max(max_depth, depth)
-
-        for d in subdirs:
-            node[d] = {}
-            _walk(os.path.join(current, d), depth + 1, node[d])
-
-    _walk(base_dir, 0, sample_tree)
-
-    # Build the columns dict: fixed slots first, then one per level
-    columns = {
-        "filename": {"header": "filename", "enabled": True},
-        "path":     {"header": "path",     "enabled": True},
-    }
-    for i in range(max_depth):
-        key = f"level_{i + 1}"
-        columns[key] = {"header": key, "enabled": True}
-
-    return {
-        "max_depth":   max_depth,
-        "columns":     columns,
-        "output_stem": "dataset",
-        "_sample_tree": sample_tree,
-    }
-
-
-# ══════════════════════════════════════════════════════════════════════════════
-#  ROW COLLECTION
-# ══════════════════════════════════════════════════════════════════════════════
-
-def collect_rows(base_dir: str, max_depth: int, columns: dict) -> list[dict]:
-    rows: list[dict] = []
-
-    def _walk(current: str, depth: int, labels: list[str]) -> None:
-        entries = sorted(os.listdir(current))
-        images  = [e for e in entries if os.path.isfile(os.path.join(current, e)) and _is_image(e)]
-        subdirs = [e for e in entries if os.path.isdir(os.path.join(current, e)) and not e.startswith(".")]
-
-        for fname in images:
-            padded = labels + [""] * (max_depth - len(labels))
-            row: dict = {}
-
-            # filename slot
-            if columns.get("filename", {}).get("enabled", True):
-                row[columns["filename"]["header"]] = fname
-
-            # path slot
-            if columns.get("path", {}).get("enabled", True):
-                rel = os.path.join(*labels, fname) if labels else fname
-                row[columns["path"]["header"]] = rel
-
-            # level slots
-            for i, label_val in enumerate(padded):
-                key = f"level_{i + 1}"
-                if columns.get(key, {}).get("enabled", True):
-                    row[columns[key]["header"]] = label_val
-
-            rows.append(row)
-
-        for d in subdirs:
-            _walk(os.path.join(current, d), depth + 1, labels + [d])
-
-    _walk(base_dir, 0, [])
-    return rows
-
-
-def active_headers(columns: dict, max_depth: int) -> list[str]:
-    """Return headers in slot order, skipping disabled ones."""
-    ordered_keys = ["filename", "path"] + [f"level_{i+1}" for i in range(max_depth)]
-    return [
-        columns[k]["header"]
-        for k in ordered_keys
-        if k in columns and columns[k].get("enabled", True)
-    ]
-
-
-def label_headers(columns: dict, max_depth: int) -> list[str]:
-    """Return only the level headers (for summary grouping), skipping disabled."""
-    return [
-        columns[f"level_{i+1}"]["header"]
-        for i in range(max_depth)
-        if columns.get(f"level_{i+1}", {}).get("enabled", True)
-    ]
-
-
-# ══════════════════════════════════════════════════════════════════════════════
-#  CSV WRITER
-# ══════════════════════════════════════════════════════════════════════════════
-
-def write_csv(rows: list[dict], headers: list[str], path: str) -> None:
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=headers, extrasaction="ignore")
-        writer.writeheader()
-        writer.writerows(rows)
-    print(f"  CSV  -> {path}  ({len(rows)} rows)")
-
-
-# ══════════════════════════════════════════════════════════════════════════════
-#  XLSX WRITER
-# ══════════════════════════════════════════════════════════════════════════════
-
-_HEADER_FILL  = PatternFill("solid", start_color="2F5496")
-_HEADER_FONT  = Font(name="Arial", bold=True, color="FFFFFF", size=11)
-_HEADER_ALIGN = Alignment(horizontal="center", vertical="center", wrap_text=True)
-_CELL_FONT    = Font(name="Arial", size=10)
-_ALIGN_L      = Alignment(horizontal="left",   vertical="center")
-_ALIGN_C      = Alignment(horizontal="center", vertical="center")
-_ODD_FILL     = PatternFill("solid", start_color="EEF2F9")
-_EVEN_FILL    = PatternFill("solid", start_color="FFFFFF")
-_THIN         = Side(style="thin", color="BFBFBF")
-_BORDER       = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
-
-
-def _col_width(header: str, rows: list[dict]) -> float:
-    max_len = len(header)
-    for row in rows[:500]:
-        val = row.get(header, "")
-        if val:
-            max_len = max(max_len, len(str(val)))
-    return min(max_len + 4, 60)
-
-
-def _build_summary(rows: list[dict], lbl_headers: list[str]) -> list[tuple]:
-    summary: list[tuple] = [("Total images", len(rows))]
-    for header in lbl_headers:
-        counts: dict[str, int] = {}
-        for row in rows:
-            val = row.get(header) or "(none)"
-            counts[val] = counts.get(val, 0) + 1
-        for val, count in sorted(counts.items()):
-            summary.append((f"{header}  =  {val}", count))
-    return summary
-
-
-def write_xlsx(rows, all_headers, lbl_headers, path):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Dataset"
-    ws.row_dimensions[1].height = 28
-
-    for col_idx, header in enumerate(all_headers, start=1):
-        cell = ws.cell(row=1, column=col_idx, value=header)
-        cell.fill = _HEADER_FILL; cell.font = _HEADER_FONT
-        cell.alignment = _HEADER_ALIGN; cell.border = _BORDER
-        ws.column_dimensions[cell.column_letter].width = _col_width(header, rows)
-
-    # path slot is left-aligned; everything else centre-aligned
-    path_header = all_headers[1] if len(all_headers) > 1 else None
-
-    for row_idx, record in enumerate(rows, start=2):
-        fill = _ODD_FILL if row_idx % 2 == 1 else _EVEN_FILL
-        for col_idx, header in enumerate(all_headers, start=1):
-            cell = ws.cell(row=row_idx, column=col_idx, value=record.get(header, ""))
-            cell.font = _CELL_FONT; cell.fill = fill; cell.border = _BORDER
-            cell.alignment = _ALIGN_L if header == path_header else _ALIGN_C
-
-    ws.freeze_panes = "A2"
-    ws.auto_filter.ref = f"A1:{get_column_letter(len(all_headers))}1"
-
-    # Summary sheet
-    ws2 = wb.create_sheet("Summary")
-    ws2.column_dimensions["A"].width = 35
-    ws2.column_dimensions["B"].width = 14
-    for col, val in [(1, "Breakdown"), (2, "Count")]:
-        c = ws2.cell(row=1, column=col, value=val)
-        c.font = Font(name="Arial", bold=True, size=11)
-
-    r_idx = 2
-    prev_group = None
-    for label, value in _build_summary(rows, lbl_headers):
-        group = label.split("  =  ")[0] if "  =  " in label else None
-        if group and group != prev_group and prev_group is not None:
-            r_idx += 1   # blank spacer row
-        prev_group = group
-        lc = ws2.cell(row=r_idx, column=1, value=label)
-        vc = ws2.cell(row=r_idx, column=2, value=value)
-        is_total = label == "Total images"
-        for cell in (lc, vc):
-            cell.font   = Font(name="Arial", size=10, bold=is_total)
-            cell.border = _BORDER
-        lc.alignment = _ALIGN_L; vc.alignment = _ALIGN_C
-        r_idx += 1
-
-    wb.save(path)
-    print(f"  XLSX -> {path}  ({len(rows)} rows, {len(all_headers)} columns)")
-
+MANIFEST_PATH = os.path.join(BASE_DIR, "dataset_manifest.json")
+HASH_CACHE_PATH = os.path.join(BASE_DIR, "dataset_hashes.json")
+META_CACHE_PATH = os.path.join(BASE_DIR, "dataset_metadata.json")
+# One verdict cache per check, so switching "validation" never reuses the other's.
+# The suffix is bumped whenever a check changes what it accepts.
+VALID_CACHE_PATH = os.path.join(BASE_DIR, "dataset_validation_{}.v2.json")
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  MAIN
@@ -260,20 +107,99 @@ def _print_tree(node: dict, indent: int = 0) -> None:
             _print_tree(val, indent + 4)
 
 
+def _depth_note(discovery: dict) -> str:
+    """One-line account of how far the first-run discovery looked."""
+    if discovery["complete"]:
+        return "exact — every folder was listed"
+    cut = []
+    if discovery["skipped"]:
+        cut.append(f"{discovery['skipped']} subfolder(s) not followed")
+    if discovery["unlisted"]:
+        cut.append(f"budget reached with {discovery['unlisted']} folder(s) unlisted")
+    return (f"lower bound — sampled {discovery['dirs']} folder(s) in {discovery['seconds']}s, "
+            f"{', '.join(cut)}.  A deeper branch may have been missed; re-run with "
+            f"--full-scan to be sure")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        description="Build dataset.csv / dataset.xlsx from a nested image folder tree.",
+    )
+    p.add_argument(
+        "--jobs", type=int, default=1,
+        help="Threads listing directories in parallel (default: 1). "
+             "Raise to 8-32 on network filesystems.",
+    )
+    p.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="Processes for the per-file stages such as duplicate hashing "
+             f"(default: {os.cpu_count()}).",
+    )
+    p.add_argument(
+        "--full-scan", action="store_true",
+        help="On the first run, walk the whole tree instead of sampling it.",
+    )
+    p.add_argument(
+        "--sample-children", type=int, default=DISCOVERY_CHILDREN, metavar="K",
+        help=f"First-run sampling: subfolders followed per folder (default: {DISCOVERY_CHILDREN}).",
+    )
+    p.add_argument(
+        "--sample-entries", type=int, default=DISCOVERY_MAX_ENTRIES, metavar="N",
+        help=f"First-run sampling: directory entries listed in total "
+             f"(default: {DISCOVERY_MAX_ENTRIES}).",
+    )
+    p.add_argument(
+        "--sample-seconds", type=float, default=DISCOVERY_SECONDS, metavar="S",
+        help=f"First-run sampling: time limit in seconds (default: {DISCOVERY_SECONDS:g}).",
+    )
+    p.add_argument(
+        "--rescan", action="store_true",
+        help="Ignore the saved directory manifest and re-list every folder.",
+    )
+    p.add_argument(
+        "--benchmark", type=int, nargs="?", const=500_000, metavar="N_FILES",
+        help="Time the walker with 1, 4 and 16 jobs and the fixed-depth walker "
+             "on a synthetic tree (default 500000 files) and exit.",
+    )
+    p.add_argument(
+        "--bench-dir", default=None,
+        help="Parent directory for the synthetic benchmark tree (default: system temp).",
+    )
+    return p
+
+
 def main() -> None:
+    args = build_parser().parse_args()
+
+    if args.benchmark:
+        benchmark_scan(args.benchmark, bench_dir=args.bench_dir)
+        return
+
     # ── First run ────────────────────────────────────────────────────────────
     if not os.path.exists(CONFIG_PATH):
-        print("No dataset_config.json found. Scanning folder structure …\n")
-        config = discover_structure(BASE_DIR)
+        new_dirs: dict = {}
+        lister = manifest_lister(BASE_DIR, {}, new_dirs, [])
+        if args.full_scan:
+            print("No dataset_config.json found. Scanning folder structure …\n")
+            config = discover_structure(BASE_DIR, args.jobs, lister)
+        else:
+            print("No dataset_config.json found. Sampling folder structure …\n")
+            config = discover_structure(BASE_DIR, args.jobs, lister, args.sample_children,
+                                        args.sample_entries, args.sample_seconds)
 
         if config["max_depth"] == 0:
-            print("No images found in any subfolder.")
+            if config["_discovery"]["complete"]:
+                print("No images found in any subfolder.")
+            else:
+                print("No images found in the sampled folders — re-run with --full-scan.")
             return
 
         write_config = lambda c, p: open(p, "w").write(json.dumps(c, indent=2))
         write_config(config, CONFIG_PATH)
+        # Seed the manifest so the next run only has to stat directories
+        save_manifest(MANIFEST_PATH, new_dirs, None, [])
 
-        print(f"Found {config['max_depth']} folder level(s).")
+        print(f"Found {config['max_depth']} folder level(s): {_depth_note(config['_discovery'])}.")
         print(f"\nConfig written to:\n  {CONFIG_PATH}\n")
         print("Edit the config to rename any 'header' value or set 'enabled': false")
         print("to drop a column, then re-run.\n")
@@ -291,23 +217,139 @@ def main() -> None:
     max_depth   = config["max_depth"]
     columns     = config["columns"]
     output_stem = config.get("output_stem", "dataset")
+    xlsx_split  = config.get("xlsx_split", "sheets")
+    rows_per_sheet = config.get("xlsx_rows_per_sheet", EXCEL_MAX_ROWS - 1)
+    formats     = config.get("formats", ["csv", "xlsx"])
+
+    if xlsx_split not in ("sheets", "files"):
+        print(f"Invalid xlsx_split {xlsx_split!r} in config — use \"sheets\" or \"files\".")
+        return
+    validation = config.get("validation", "header")
+    if validation not in VALIDATION_CHECKS:
+        print(f"Invalid validation {validation!r} in config — choose from {list(VALIDATION_CHECKS)}.")
+        return
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        print(f"Invalid formats {unknown or formats} in config — choose from {list(OUTPUT_FORMATS)}.")
+        return
 
     all_hdrs = active_headers(columns, max_depth)
-    lbl_hdrs = label_headers(columns, max_depth)
+    lbl_idx  = label_positions(columns, max_depth)
+    int_idx  = int_positions(columns, max_depth)
 
     print("Config loaded.")
     print(f"  Depth   : {max_depth} level(s)")
     print(f"  Columns : {all_hdrs}\n")
 
-    rows = collect_rows(BASE_DIR, max_depth, columns)
+    # Stat every directory against the manifest, re-listing only those whose
+    # mtime moved.  The resulting listings are the patched row set.
+    manifest = {} if args.rescan else load_manifest(MANIFEST_PATH)
+    old_dirs = manifest.get("dirs", {})
+    new_dirs: dict = {}
+    changed:  list = []
+    scan_info: dict = {}
+    for _ in scan_tree(BASE_DIR, scan_info, args.jobs,
+                       manifest_lister(BASE_DIR, old_dirs, new_dirs, changed)):
+        pass
+    removed = old_dirs.keys() - new_dirs.keys()
+
+    if scan_info["max_depth"] > max_depth:
+        print(f"Note: images found {scan_info['max_depth']} level(s) deep, but the config "
+              f"only has {max_depth}. Delete {os.path.basename(CONFIG_PATH)} and re-run with "
+              f"--full-scan to re-discover.\n")
+
+    # Rows stream from the manifest listings into `write_outputs`.
+    listing = frozen_lister(BASE_DIR, new_dirs)
+    enabled = set(active_slots(columns, max_depth))
+
+    rel_paths: list[str] = []
+    fingerprint = config_fingerprint(config)
+    if enabled & set(EXTRA_SLOTS):
+        rel_paths = [os.path.join(*labels, fname)
+                     for labels, fname in scan_tree(BASE_DIR, list_dir=listing)]
+        fingerprint += ":" + files_fingerprint(BASE_DIR, rel_paths)
+    outputs_ok  = manifest.get("outputs") and all(os.path.exists(p) for p in manifest["outputs"])
+    if (not changed and not removed and outputs_ok
+            and manifest.get("fingerprint") == fingerprint):
+        print(f"No changes in {len(new_dirs)} folder(s) since the last run — outputs are up to date.")
+        return
 
-    if not rows:
+    if changed or removed:
+        if manifest:
+            print(f"{len(changed)} folder(s) changed, {len(removed)} removed since the last run.\n")
+    elif manifest.get("fingerprint") not in (None, fingerprint):
+        print("Config or file contents changed since the last run.\n")
+
+    # Splits are assigned per stratum from the listings before rows stream,
+    # and ride along in the tally key so the Summary can break them down by
+    # the stratification levels without another pass.
+    split_of, tally_idx = None, lbl_idx
+    split_names, strata = None, []
+    if "split" in enabled:
+        ratios   = config.get("split_ratios", DEFAULT_SPLIT_RATIOS)
+        stratify = config.get("split_stratify", ["level_1"])
+        lbl_keys = [k for k in active_slots(columns, max_depth) if k.startswith("level_")]
+        bad = [k for k in stratify if k not in lbl_keys]
+        if bad or not ratios or min(ratios.values()) < 0 or sum(ratios.values()) <= 0:
+            print(f"Invalid split config — split_stratify must name enabled level slots "
+                  f"(got {bad or stratify}) and split_ratios must be non-negative weights.")
+            return
+        strata      = [(lbl_keys.index(k), columns[k]["header"]) for k in stratify]
+        split_of    = split_assigner(ratios, scan_tree(BASE_DIR, list_dir=listing),
+                                     [int(k.split("_")[1]) - 1 for k in stratify],
+                                     config.get("split_seed", 0))
+        split_names = list(ratios)
+        tally_idx   = lbl_idx + [active_slots(columns, max_depth).index("split")]
+    extra:  dict = {}
+    extra_sheets: list[tuple] = []
+
+    if enabled & set(METADATA_SLOTS):
+        print("Reading image headers …")
+        meta = run_file_stage(BASE_DIR, rel_paths, read_image_header, META_CACHE_PATH,
+                              args.workers, "metadata")
+        for j, key in enumerate(METADATA_SLOTS):
+            extra[key] = {rel: values[j] for rel, values in meta.items()}
+        print()
+        del meta
+
+    if "valid" in enabled:
+        print(f"Validating images ({validation} check) …")
+        verdicts = run_file_stage(BASE_DIR, rel_paths, VALIDATION_CHECKS[validation],
+                                  VALID_CACHE_PATH.format(validation), args.workers, "validation")
+        extra["valid"] = {rel: "no" if reason else "yes" for rel, reason in verdicts.items()}
+        bad_rows = [(rel, reason) for rel in rel_paths if (reason := verdicts.get(rel))]
+        extra_sheets.append(("Corrupt", ["path", "reason"], bad_rows))
+        print(f"  {len(bad_rows)} corrupt image(s)\n")
+        del verdicts
+
+    if enabled & {"content_hash", "duplicate_group"}:
+        print("Hashing images for duplicate detection …")
+        hashes = run_file_stage(BASE_DIR, rel_paths, hash_image, HASH_CACHE_PATH,
+                                args.workers, "hashes")
+        groups, dup_rows = find_duplicates(rel_paths, hashes,
+                                           config.get("near_duplicate_distance", 4))
+        extra["content_hash"]    = {rel: h[0] for rel, h in hashes.items()}
+        extra["duplicate_group"] = groups
+        extra_sheets.append(("Duplicates", ["duplicate_group", "path", "content_hash", "match"],
+                             dup_rows))
+        print(f"  {len(groups)} image(s) in {dup_rows[-1][0] if dup_rows else 0} duplicate group(s)\n")
+        del hashes
+    del rel_paths
+
+    print("Writing outputs …\n")
+    rows = collect_rows(BASE_DIR, max_depth, columns, list_dir=listing, extra=extra,
+                        split_of=split_of)
+    n_rows, outputs = write_outputs(
+        rows, all_hdrs, lbl_idx, os.path.join(BASE_DIR, output_stem), formats,
+        tally_idx, int_idx, rows_per_sheet, xlsx_split, extra_sheets,
+        split_names, strata,
+        (manifest or load_manifest(MANIFEST_PATH)).get("outputs") or [],
+    )
+    if not n_rows:
         print("No images found.")
         return
 
-    print(f"Found {len(rows)} image(s). Writing outputs …\n")
-    write_csv(rows,  all_hdrs, os.path.join(BASE_DIR, f"{output_stem}.csv"))
-    write_xlsx(rows, all_hdrs, lbl_hdrs, os.path.join(BASE_DIR, f"{output_stem}.xlsx"))
+    save_manifest(MANIFEST_PATH, new_dirs, fingerprint, outputs)
     print("\nDone.")
 
 
@@ -0,0 +1,36 @@
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("openpyxl")
+
+SCRIPTS = Path(__file__).resolve().parent.parent / "Scripts"
+
+
+def _run(root):
+    out = subprocess.run([sys.executable, str(root / "labeler_non_universal.py")], cwd=root,
+                         capture_output=True, text=True, check=True)
+    return out.stdout
+
+
+def test_depth_mismatch_keeps_previous_outputs(tmp_path):
+    for script in ("labeler_non_universal.py", "labeling.py"):
+        shutil.copy(SCRIPTS / script, tmp_path)
+    leaf = tmp_path / "cc-by" / "wheat" / "good"
+    leaf.mkdir(parents=True)
+    (leaf / "a.jpg").write_bytes(b"x")
+
+    _run(tmp_path)
+    outputs = {name: (tmp_path / name).read_bytes() for name in ("dataset.csv", "dataset.xlsx")}
+
+    # One label header too many: nothing sits four levels deep any more
+    script = tmp_path / "labeler_non_universal.py"
+    source = script.read_text(encoding="utf-8")
+    script.write_text(source.replace('"quality",', '"quality",\n    "extra",', 1), encoding="utf-8")
+
+    assert "No files found" in _run(tmp_path)
+    assert {name: (tmp_path / name).read_bytes() for name in outputs} == outputs
+    assert not (tmp_path / "dataset.csv.tmp").exists()
@@ -0,0 +1,85 @@
+import io
+from collections import Counter
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("openpyxl")
+
+from labeling import check_image_decode, check_image_header, split_assigner, write_outputs  # noqa: E402
+
+# What a motion photo appends after the still: an MP4 with no FF D9 near its end
+MP4_TRAILER = b"\0\0\0\x18ftypmp42" + bytes(8) + b"\0\0\x10\0mdat" + bytes(4096)
+
+
+def _encode(fmt, **options):
+    im = Image.effect_mandelbrot((240, 160), (-2, -1.5, 1, 1.5), 64).convert("RGB")
+    buf = io.BytesIO()
+    im.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+@pytest.fixture(params=[{}, {"progressive": True}, {"restart_marker_blocks": 1}],
+                ids=["baseline", "progressive", "restarts"])
+def jpeg(request):
+    return _encode("JPEG", **request.param)
+
+
+@pytest.mark.parametrize("check", [check_image_header, check_image_decode])
+def test_jpeg_with_appended_data_is_valid(tmp_path, jpeg, check):
+    path = tmp_path / "motion.jpg"
+    path.write_bytes(jpeg + MP4_TRAILER)
+    assert check(str(path)) == ""
+
+
+@pytest.mark.parametrize("check", [check_image_header, check_image_decode])
+def test_png_with_appended_data_is_valid(tmp_path, check):
+    path = tmp_path / "trailer.png"
+    path.write_bytes(_encode("PNG") + MP4_TRAILER)
+    assert check(str(path)) == ""
+
+
+def test_truncated_jpeg_is_reported(tmp_path, jpeg):
+    path = tmp_path / "cut.jpg"
+    path.write_bytes(jpeg[:len(jpeg) * 2 // 3])
+    assert check_image_header(str(path)) == "truncated: no end-of-image marker"
+    assert "truncated" in check_image_decode(str(path))
+
+
+RATIOS = {"train": 0.7, "val": 0.15, "test": 0.15}
+
+
+def _items(counts):
+    return [([cls, "batch"], f"{i}.jpg") for cls, n in counts.items() for i in range(n)]
+
+
+def test_split_quotas_hold_in_every_stratum():
+    items = _items({"cats": 20, "dogs": 10, "eels": 7})
+    split_of = split_assigner(RATIOS, items, levels=[0])
+
+    by_stratum = Counter((labels[0], split_of(labels, fname)) for labels, fname in items)
+    assert [by_stratum["cats", s] for s in RATIOS] == [14, 3, 3]
+    assert [by_stratum["dogs", s] for s in RATIOS] == [7, 2, 1]
+    assert [by_stratum["eels", s] for s in RATIOS] == [5, 1, 1]
+
+
+def test_split_moves_few_images_when_a_stratum_grows():
+    items = _items({"cats": 40, "dogs": 40})
+    before = split_assigner(RATIOS, items, levels=[0], seed=3)
+    after  = split_assigner(RATIOS, items + [(["cats", "batch"], "new.jpg")], levels=[0], seed=3)
+
+    moved = [item for item in items if before(*item) != after(*item)]
+    assert len(moved) <= 2 and all(labels[0] == "cats" for labels, _ in moved)
+
+
+def test_failed_write_keeps_previous_csv(tmp_path):
+    (tmp_path / "dataset.csv").write_text("old\n")
+
+    def rows():
+        yield ("a.jpg", "cats/a.jpg", "cats")
+        raise OSError("share went away")
+
+    with pytest.raises(OSError):
+        write_outputs(rows(), ["name", "path", "class"], [2], str(tmp_path / "dataset"), ["csv"])
+    assert (tmp_path / "dataset.csv").read_text() == "old\n"
+    assert not (tmp_path / "dataset.csv.tmp").exists()
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+pymupdf4llm = pytest.importorskip("pymupdf4llm")
+
+import paper_converter  # noqa: E402
+
+
+def _diagram_pdf(path, n_pages):
+    """Pages with a heading, body text and a labelled box diagram ("picture text")."""
+    doc = pymupdf.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Section {i + 1}", fontsize=18 if i % 7 else 22)
+        page.insert_text((72, 110), f"Body text on page {i + 1}. " * 3, fontsize=10)
+        for k in range(6):
+            x, y = 72 + (k % 3) * 150, 180 + (k // 3) * 80
+            page.draw_rect(pymupdf.Rect(x, y, x + 110, y + 50), color=(0, 0, 0), fill=(0.9, 0.9, 1))
+            page.insert_text((x + 8, y + 28), f"Node {k} p{i + 1}", fontsize=8)
+            if k % 3 < 2:
+                page.draw_line((x + 110, y + 25), (x + 150, y + 25))
+        page.insert_text((72, 400), "More paragraph text follows here. " * 2, fontsize=10)
+    doc.save(path)
+
+
+needs_layout = pytest.mark.skipif(not getattr(pymupdf4llm, "_use_layout", False),
+                                  reason="page ranges need the pymupdf layout engine")
+
+
+@needs_layout
+def test_page_ranges_match_whole_document(tmp_path, monkeypatch):
+    pdf = tmp_path / "diagrams.pdf"
+    _diagram_pdf(pdf, 35)
+    monkeypatch.setattr(paper_converter, "CHUNK_PAGES", 10)   # 4 ranges, the last one short
+
+    whole = pymupdf4llm.to_markdown(pdf, **paper_converter.TO_MARKDOWN_OPTIONS)
+    with ProcessPoolExecutor(2) as pool:
+        ranged = paper_converter.convert_page_ranges(pdf, 35, pool)
+
+    assert "picture text" in whole
+    assert ranged == whole
+
+
+@needs_layout
+def test_failed_page_ranges_fall_back_to_whole_document(tmp_path, monkeypatch):
+    pdf, md = tmp_path / "long.pdf", tmp_path / "long.md"
+    _diagram_pdf(pdf, 12)
+
+    def moved(*args, **kwargs):
+        raise TypeError("parse_document() got an unexpected keyword argument 'image_dpi'")
+
+    monkeypatch.setattr(paper_converter, "convert_page_ranges", moved)
+    with ProcessPoolExecutor(1) as pool:
+        assert paper_converter.convert_pdf_to_md(pdf, md, pool, split_pages=5)
+    assert md.read_text(encoding="utf-8") == \
+        pymupdf4llm.to_markdown(pdf, **paper_converter.TO_MARKDOWN_OPTIONS).strip()
+
+
+@needs_layout
+def test_broken_page_pool_falls_back_and_is_detected(tmp_path):
+    pdf, md = tmp_path / "long.pdf", tmp_path / "long.md"
+    _diagram_pdf(pdf, 12)
+    pool = ProcessPoolExecutor(1)
+    try:
+        assert not paper_converter.pool_broken(pool)
+        with pytest.raises(Exception):
+            pool.submit(os._exit, 1).result()           # a worker crashing inside MuPDF
+
+        assert paper_converter.convert_pdf_to_md(pdf, md, pool, split_pages=5)
+        assert "Section 12" in md.read_text(encoding="utf-8")
+        assert paper_converter.pool_broken(pool)
+    finally:
+        pool.shutdown(wait=False)
@@ -0,0 +1,265 @@
+import importlib.util
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("tqdm")
+
+import paper_downloader  # noqa: E402
+from paper_downloader import HostLimiter, download_all, download_file, thread_session  # noqa: E402
+
+BODY = b"%PDF-1.4\n" + bytes(range(256)) * 1200 + b"\n%%EOF\n"
+
+
+class FakePDFHandler(paper_downloader.LatencyHandler):
+    """
+    Serves a fake PDF for every path and records what the client did.
+    Paths containing "missing" are 404s and "html" an error page; the first
+    `drop` responses to a "flaky" path are cut off a third of the way in.
+    `ranges` and ETags (bumped through `version`) can be switched per test.
+    """
+
+    state = None
+
+    def do_GET(self):
+        st = self.state
+        host = self.headers["Host"].split(":")[0]
+        with st["lock"]:
+            st["hits"][self.path] += 1
+            hit = st["hits"][self.path]
+            st["starts"][host].append(time.monotonic())
+            st["requests"].append((self.path, dict(self.headers)))
+            # Counted only up to the response, which the client is still waiting
+            # for: a finished body can't overlap the client's next request here
+            st["active"][host] += 1
+            st["active"]["*"] += 1
+            for key in (host, "*"):
+                st["peak"][key] = max(st["peak"][key], st["active"][key])
+        try:
+            time.sleep(self.latency)
+        finally:
+            with st["lock"]:
+                st["active"][host] -= 1
+                st["active"]["*"] -= 1
+
+        if "missing" in self.path:
+            return self._reply(404, b"")
+        if "html" in self.path:
+            return self._reply(200, b"<!DOCTYPE html><html>Rate limited</html>", "text/html")
+
+        body = st["bodies"].get(self.path, BODY)
+        etag = f'"v{st["version"][self.path]}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304, b"", etag=etag)
+
+        status, start = 200, 0
+        if_range = self.headers.get("If-Range")
+        if self.headers.get("Range") and st["ranges"] and if_range in (None, etag):
+            start = int(self.headers["Range"].split("=")[1].split("-")[0])
+            status = 206
+        payload = body[start:]
+        extra = {"Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"} if status == 206 else {}
+        if "flaky" in self.path and hit <= st["drop"]:
+            self._reply(status, payload, etag=etag, cut=len(payload) // 3, **extra)
+        else:
+            self._reply(status, payload, etag=etag, **extra)
+
+    def _reply(self, status, payload, content_type="application/pdf", etag=None, cut=None, **headers):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if etag:
+            self.send_header("ETag", etag)
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        if cut is None:
+            self.wfile.write(payload)
+            return
+        self.wfile.write(payload[:cut])
+        self.wfile.flush()
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+
+
+class FakeServer:
+    def __init__(self, url, state):
+        self.url = url
+        self.port = int(url.rsplit(":", 1)[1])
+        self.state = state
+
+    @staticmethod
+    def new_state():
+        return {
+            "lock": threading.Lock(), "hits": defaultdict(int), "starts": defaultdict(list),
+            "active": defaultdict(int), "peak": defaultdict(int), "requests": [],
+            "version": defaultdict(lambda: 1), "bodies": {}, "drop": 0, "ranges": True,
+        }
+
+    def on(self, host, path):
+        return f"http://{host}:{self.port}{path}"
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """start_server(latency) -> FakeServer serving fake PDFs on 127.0.0.1 and localhost."""
+    with ExitStack() as stack:
+        def start(latency=0.0):
+            state = FakeServer.new_state()
+            handler = type("Handler", (FakePDFHandler,), {"state": state})
+            url = stack.enter_context(paper_downloader.serve_directory(tmp_path, latency, handler))
+            return FakeServer(url, state)
+        yield start
+
+
+BACKENDS = ["threads"] + (["async"] if importlib.util.find_spec("httpx") else [])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_concurrent_downloads_respect_per_host_limit(start_server, tmp_path, backend):
+    server = start_server(latency=0.2)
+    out = tmp_path / "out"
+    out.mkdir()
+    jobs = [(server.on(host, f"/{host}-{i}.pdf"), str(out / f"{host}-{i}.pdf"))
+            for host in ("127.0.0.1", "localhost") for i in range(6)]
+
+    t0 = time.monotonic()
+    outcomes = paper_downloader.run_backend(backend, jobs, workers=8, per_host=2, delay=0)
+    elapsed = time.monotonic() - t0
+
+    assert outcomes["downloaded"] == 12
+    assert all(open(path, "rb").read() == BODY for _, path in jobs)
+    assert server.state["peak"]["127.0.0.1"] <= 2
+    assert server.state["peak"]["localhost"] <= 2
+    assert server.state["peak"]["*"] >= 3              # both hosts in flight at once
+    assert elapsed < 12 * 0.2 * 0.75                   # well under one-at-a-time
+
+
+def test_delay_spaces_request_starts_per_host(start_server, tmp_path):
+    server = start_server()
+    jobs = [(server.on("127.0.0.1", f"/p{i}.pdf"), str(tmp_path / f"p{i}.pdf")) for i in range(3)]
+
+    download_all(jobs, workers=3, limiter=HostLimiter(max_per_host=3, min_interval=0.3))
+
+    starts = server.state["starts"]["127.0.0.1"]
+    assert len(starts) == 3
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 0.25
+
+
+def test_partial_download_stays_in_part_file(start_server, tmp_path, monkeypatch):
+    server = start_server()
+    server.state["drop"] = 99                          # every attempt is cut off
+    monkeypatch.setattr(paper_downloader, "MAX_RETRIES", 1)
+    target = tmp_path / "flaky.pdf"
+
+    assert download_file(thread_session(), server.on("127.0.0.1", "/flaky.pdf"), str(target)) == "failed"
+    assert not target.exists()                         # never a half-written final file
+    assert 0 < (tmp_path / "flaky.pdf.part").stat().st_size < len(BODY)
+
+
+def test_completed_download_replaces_target_atomically(start_server, tmp_path):
+    server = start_server()
+    target = tmp_path / "paper.pdf"
+    target.write_bytes(b"old")
+    inode = target.stat().st_ino
+
+    download_file(thread_session(), server.on("127.0.0.1", "/paper.pdf"), str(target))
+
+    assert target.read_bytes() == BODY
+    assert target.stat().st_ino != inode               # renamed into place, not rewritten
+    assert not (tmp_path / "paper.pdf.part").exists()
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_dropped_connection_resumes_or_restarts(start_server, tmp_path, ranges, capsys):
+    server = start_server()
+    server.state.update(drop=1, ranges=ranges)
+    target = tmp_path / "flaky.pdf"
+
+    outcome = download_file(thread_session(), server.on("127.0.0.1", "/flaky.pdf"), str(target),
+                            show_progress=False)
+
+    assert outcome == "downloaded"
+    assert target.read_bytes() == BODY
+    second = server.state["requests"][1][1]
+    assert "Range" in second                           # the retry asked for the rest
+    assert ("Resuming" in capsys.readouterr().out) == ranges
+
+
+def test_resume_is_guarded_by_if_range(start_server, tmp_path, monkeypatch):
+    server = start_server()
+    server.state["drop"] = 99
+    monkeypatch.setattr(paper_downloader, "MAX_RETRIES", 1)
+    url, target = server.on("127.0.0.1", "/flaky.pdf"), tmp_path / "flaky.pdf"
+    assert download_file(thread_session(), url, str(target), show_progress=False) == "failed"
+    assert json.loads((tmp_path / "flaky.pdf.part.json").read_text())["etag"] == '"v1"'
+
+    # A new version is published before the next run resumes
+    newer = b"%PDF-1.5\n" + bytes(reversed(range(256))) * 1500 + b"\n%%EOF\n"
+    server.state.update(drop=0, bodies={"/flaky.pdf": newer}, version={"/flaky.pdf": 2})
+    assert download_file(thread_session(), url, str(target), show_progress=False) == "downloaded"
+
+    assert target.read_bytes() == newer                # not old head + new tail
+    assert server.state["requests"][-1][1]["If-Range"] == '"v1"'
+    assert not os.path.exists(str(target) + ".part.json")
+
+
+def test_resume_rejects_content_range_of_another_length(start_server, tmp_path, monkeypatch, capsys):
+    server = start_server()
+    server.state["drop"] = 1
+    monkeypatch.setattr(paper_downloader, "MAX_RETRIES", 1)
+    url, target = server.on("127.0.0.1", "/flaky.pdf"), tmp_path / "flaky.pdf"
+    assert download_file(thread_session(), url, str(target), show_progress=False) == "failed"
+    meta_path = tmp_path / "flaky.pdf.part.json"
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({**meta, "length": meta["length"] + 1}))
+
+    assert download_file(thread_session(), url, str(target), show_progress=False) == "failed"
+    assert "different file" in capsys.readouterr().out
+    assert not (tmp_path / "flaky.pdf.part").exists()  # the next run starts over
+
+
+def test_existing_files_are_skipped(start_server, tmp_path, monkeypatch, capsys):
+    server = start_server()
+    monkeypatch.setattr(paper_downloader, "papers", {
+        "Cat": [("01 First", server.on("127.0.0.1", "/a.pdf")),
+                ("02 Second", server.on("localhost", "/b.pdf"))],
+    })
+    argv = ["paper_downloader.py", "--dest", str(tmp_path / "lib"), "--delay", "0"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    paper_downloader.main()
+    hits = sum(server.state["hits"].values())
+    assert sorted(os.listdir(tmp_path / "lib" / "Cat")) == ["01. First.pdf", "02. Second.pdf"]
+    capsys.readouterr()
+
+    paper_downloader.main()
+    assert sum(server.state["hits"].values()) == hits  # nothing fetched again
+    assert capsys.readouterr().out.count("Already exists") == 2
+
+
+@pytest.mark.parametrize("name, text", [
+    ("bare.yaml", "Papers:\n  - 2104.09860\n"),
+    ("pair.json", '{"Papers": [["T", 1910.07460]]}'),
+    ("mapping.yaml", "Papers:\n  - {title: T, arxiv: 2104.09860}\n"),
+])
+def test_catalog_rejects_unquoted_arxiv_ids(tmp_path, name, text):
+    if name.endswith(".yaml"):
+        pytest.importorskip("yaml")
+    path = tmp_path / name
+    path.write_text(text)
+
+    with pytest.raises(ValueError, match="quote arXiv IDs"):
+        paper_downloader.load_catalog(str(path))
+
+    path.write_text(text.replace("2104.09860", '"2104.09860"').replace("1910.07460", '"1910.07460"'))
+    [(title, ref)] = paper_downloader.load_catalog(str(path))["Papers"]
+    assert ref in ("2104.09860", "1910.07460")
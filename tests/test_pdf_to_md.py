@@ -0,0 +1,51 @@
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+import pdf_to_md  # noqa: E402
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    """Stand-in for marker: page text tagged with the page count of the document it saw."""
+    calls = []
+
+    def convert(pdf_path):
+        calls.append(pdf_path)
+        with pymupdf.open(pdf_path) as doc:
+            return "\n\n".join(f"{page.get_text().strip()} ({doc.page_count} pages)\n" for page in doc)
+
+    monkeypatch.setattr(pdf_to_md, "convert_pdf", convert)
+    return calls
+
+
+def _pdf(path, text):
+    with pymupdf.open() as doc:
+        doc.new_page().insert_text((72, 72), text, fontsize=12)
+        doc.save(path)
+    return path
+
+
+def test_merged_batch_output_is_not_served_to_standalone_runs(tmp_path, converted):
+    cache, out = tmp_path / "cache", tmp_path / "Converted"
+    out.mkdir()
+    batch = [(_pdf(tmp_path / "a.pdf", "paper a"), out), (_pdf(tmp_path / "b.pdf", "paper b"), out)]
+
+    results = pdf_to_md.process_batch(batch, False, "", cache)
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    assert "(3 pages)" in (out / "a.md").read_text()       # cut from the merged document
+    assert len(converted) == 1
+
+    # Another batch run may reuse it...
+    (out / "a.md").unlink()
+    (out / "b.md").unlink()
+    results = pdf_to_md.process_batch(batch, False, "", cache)
+    assert [r["cached"] for r in results] == [True, True]
+    assert len(converted) == 1
+
+    # ...but a standalone conversion of the same content is done afresh
+    (out / "a.md").unlink()
+    result = pdf_to_md.process_pdf(tmp_path / "a.pdf", out, False, "", cache)
+    assert result["cached"] is False
+    assert "(1 pages)" in (out / "a.md").read_text()
+    assert len(converted) == 2
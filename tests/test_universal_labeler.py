@@ -0,0 +1,125 @@
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+SCRIPTS = Path(__file__).resolve().parent.parent / "Scripts"
+
+
+def _age(root, seconds=3600):
+    """Push every mtime out of the manifest's racy window."""
+    old = time.time() - seconds
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (old, old))
+        os.utime(dirpath, (old, old))
+
+
+def _run(root):
+    out = subprocess.run([sys.executable, str(root / "universal_labeler.py")], cwd=root,
+                         capture_output=True, text=True, check=True)
+    return out.stdout
+
+
+def _rows(root):
+    with open(root / "dataset.csv", newline="", encoding="utf-8") as f:
+        return {row["path"]: row for row in csv.DictReader(f)}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for script in ("universal_labeler.py", "labeling.py"):
+        shutil.copy(SCRIPTS / script, tmp_path)
+    (tmp_path / "cats" / "a").mkdir(parents=True)
+    (tmp_path / "dogs" / "b").mkdir(parents=True)
+    Image.new("RGB", (10, 10), "red").save(tmp_path / "cats" / "a" / "x.jpg")
+    Image.new("RGB", (20, 20), "blue").save(tmp_path / "dogs" / "b" / "y.jpg")
+    (tmp_path / "cats" / "a" / "empty.jpg").touch()
+    _age(tmp_path)
+
+    _run(tmp_path)                              # first run writes the config
+    config_path = tmp_path / "dataset_config.json"
+    config = json.loads(config_path.read_text())
+    for slot in ("content_hash", "width", "height", "file_size", "valid"):
+        config["columns"][slot]["enabled"] = True
+    config["formats"] = ["csv"]
+    config_path.write_text(json.dumps(config))
+    return tmp_path
+
+
+def test_unchanged_tree_is_up_to_date(tree):
+    _run(tree)
+    assert "outputs are up to date" in _run(tree)
+
+
+def test_file_overwritten_in_place_refreshes_per_file_columns(tree):
+    _run(tree)
+    row = _rows(tree)["cats/a/empty.jpg"]
+    assert (row["file_size"], row["valid"]) == ("0", "no")
+
+    folder_mtime = os.stat(tree / "cats" / "a").st_mtime_ns
+    target = tree / "cats" / "a" / "empty.jpg"
+    Image.new("RGB", (99, 77), "green").save(target)
+    old = time.time() - 1800
+    os.utime(target, (old, old))
+    assert os.stat(tree / "cats" / "a").st_mtime_ns == folder_mtime
+
+    assert "up to date" not in _run(tree)
+    row = _rows(tree)["cats/a/empty.jpg"]
+    assert (row["width"], row["height"], row["valid"]) == ("99", "77", "yes")
+    assert int(row["file_size"]) > 0
+
+
+def test_split_is_stratified(tree):
+    config_path = tree / "dataset_config.json"
+    config = json.loads(config_path.read_text())
+    config["columns"]["split"]["enabled"] = True
+    config.update(split_ratios={"train": 0.6, "test": 0.4}, split_stratify=["level_1"])
+    config_path.write_text(json.dumps(config))
+    header = config["columns"]["split"]["header"]
+
+    _run(tree)
+    rows = _rows(tree)
+    cats = sorted(rows[p][header] for p in ("cats/a/x.jpg", "cats/a/empty.jpg"))
+    assert cats == ["test", "train"]                  # 1.2 and 0.8 round to one each, whatever the hashes
+    assert rows["dogs/b/y.jpg"][header] == "train"    # a lone image goes to the largest quota
+
+
+def test_empty_tree_keeps_previous_outputs(tree):
+    _run(tree)
+    before = (tree / "dataset.csv").read_bytes()
+    shutil.rmtree(tree / "cats")
+    shutil.rmtree(tree / "dogs")
+
+    assert "No images found" in _run(tree)
+    assert (tree / "dataset.csv").read_bytes() == before
+    assert not (tree / "dataset.csv.tmp").exists()
+
+
+def test_stale_xlsx_shards_are_removed(tree):
+    config_path = tree / "dataset_config.json"
+    config = json.loads(config_path.read_text())
+    config.update(formats=["csv", "xlsx"], xlsx_rows_per_sheet=1, xlsx_split="files")
+    config_path.write_text(json.dumps(config))
+    _run(tree)
+    assert sorted(p.name for p in tree.glob("dataset*.xlsx")) == \
+        ["dataset_1.xlsx", "dataset_2.xlsx", "dataset_3.xlsx"]
+
+    config.update(xlsx_rows_per_sheet=2)               # fewer shards
+    config_path.write_text(json.dumps(config))
+    _run(tree)
+    assert sorted(p.name for p in tree.glob("dataset*.xlsx")) == ["dataset_1.xlsx", "dataset_2.xlsx"]
+
+    config.update(xlsx_split="sheets")                 # one workbook again
+    config_path.write_text(json.dumps(config))
+    (tree / "dataset_notes.xlsx").touch()              # not ours to remove
+    _run(tree)
+    assert sorted(p.name for p in tree.glob("dataset*.xlsx")) == ["dataset.xlsx", "dataset_notes.xlsx"]